@@ -0,0 +1,214 @@
+"""
+Measures the memory and ready time of the bot's cache policy on a simulated large
+guild, against pycord's defaults.
+
+A guild is fed through the client's gateway parsers as it would arrive: the guild
+itself, the member chunks if the policy chunks at startup, then a stream of
+messages, and the member chunks last if the policy chunks lazily. No connection
+is made. Each policy runs in a fresh interpreter so their memory does not mix.
+
+Run from the repository root with `python -m benchmarks.bench_cache --members 200000`.
+"""
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+
+from time import perf_counter
+
+GUILD_ID = 10**17
+CHANNEL_ID = GUILD_ID + 1
+CHUNK_SIZE = 1000
+
+POLICIES = {
+    "pycord defaults": {
+        "member_cache": ["voice", "joined", "interaction"],
+        "chunk_guilds": "on",
+        "message_cache": 1000,
+    },
+    "lazy chunking": {"member_cache": [], "chunk_guilds": "lazy", "message_cache": 0},
+    "config.yaml": None,
+}
+
+
+def user(i: int) -> dict:
+    return {
+        "id": str(GUILD_ID + 10 + i),
+        "username": f"user{i}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+    }
+
+
+def member(i: int) -> dict:
+    return {
+        "user": user(i),
+        "roles": [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def guild(members: int) -> dict:
+    return {
+        "id": str(GUILD_ID),
+        "name": "large",
+        "owner_id": user(0)["id"],
+        "roles": [
+            {
+                "id": str(GUILD_ID),
+                "name": "@everyone",
+                "permissions": "0",
+                "position": 0,
+                "color": 0,
+                "colors": {"primary_color": 0, "secondary_color": None, "tertiary_color": None},
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+        ],
+        "channels": [
+            {"id": str(CHANNEL_ID), "type": 0, "name": "general", "position": 0, "permission_overwrites": []}
+        ],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "large": True,
+        "member_count": members,
+        # Large guilds only arrive with a few members, the rest come in chunks
+        "members": [member(i) for i in range(min(members, 10))],
+        "presences": [],
+        "voice_states": [],
+        "threads": [],
+    }
+
+
+def message(i: int, members: int) -> dict:
+    author = i * 7919 % members
+    return {
+        "id": str(GUILD_ID + 10**6 + i),
+        "channel_id": str(CHANNEL_ID),
+        "guild_id": str(GUILD_ID),
+        "author": user(author),
+        "member": {key: value for key, value in member(author).items() if key != "user"},
+        "content": f"message {i}",
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+def peak_rss() -> int:
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def chunk(state, members: int):
+    from discord.state import ChunkRequest
+
+    # Members of a chunk are only kept for a request the client made, as chunk_guild does
+    request = ChunkRequest(
+        GUILD_ID, asyncio.get_running_loop(), state._get_guild, cache=state.member_cache_flags.joined
+    )
+    state._chunk_requests[GUILD_ID] = request
+    count = -(-members // CHUNK_SIZE)
+    for index in range(count):
+        state.parse_guild_members_chunk(
+            {
+                "guild_id": str(GUILD_ID),
+                "members": [member(i) for i in range(index * CHUNK_SIZE, min(members, (index + 1) * CHUNK_SIZE))],
+                "chunk_index": index,
+                "chunk_count": count,
+                "nonce": request.nonce,
+            }
+        )
+
+
+async def measure(policy: dict, members: int, messages: int) -> dict:
+    import discord
+
+    from bot.utils.cache_policy import client_options
+
+    baseline = peak_rss()
+    options = client_options(**policy)
+    client = discord.Client(**options)
+    state = client._connection
+
+    start = perf_counter()
+    state._add_guild(discord.Guild(data=guild(members), state=state))  # type: ignore
+    if options["chunk_guilds_at_startup"]:
+        chunk(state, members)
+    ready = perf_counter() - start
+    ready_rss = peak_rss()
+
+    for i in range(messages):
+        state.parse_message_create(message(i, members))
+    if policy["chunk_guilds"] == "lazy":
+        chunk(state, members)
+
+    cached = state._get_guild(GUILD_ID)
+    return {
+        "ready": ready,
+        "ready_rss": ready_rss - baseline,
+        "rss": peak_rss() - baseline,
+        "members": len(cached.members),
+        "messages": len(state._messages or ()),
+    }
+
+
+def run_policy(label: str, policy: dict, members: int, messages: int):
+    result = subprocess.run(
+        [
+            sys.executable, "-m", "benchmarks.bench_cache", "--child", json.dumps(policy),
+            "--members", str(members), "--messages", str(messages),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        print(f"{label:<18} failed: {result.stderr.strip().splitlines()[-1]}")
+        return
+    measured = json.loads(result.stdout)
+    print(
+        f"{label:<18} {measured['ready'] * 1000:>9.0f}ms {measured['ready_rss'] / 2**20:>9.1f}MB"
+        f" {measured['rss'] / 2**20:>9.1f}MB {measured['members']:>9} {measured['messages']:>9}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure(json.loads(args.child), args.members, args.messages))))
+        return
+
+    from bot.constants import CACHE_CHUNK_GUILDS, CACHE_MEMBERS, CACHE_MESSAGES
+
+    POLICIES["config.yaml"] = {
+        "member_cache": CACHE_MEMBERS,
+        "chunk_guilds": CACHE_CHUNK_GUILDS,
+        "message_cache": CACHE_MESSAGES,
+    }
+    print(f"{'policy':<18} {'ready':>11} {'ready RSS':>11} {'final RSS':>11} {'members':>9} {'messages':>9}")
+    for label, policy in POLICIES.items():
+        run_policy(label, policy, args.members, args.messages)
+
+
+if __name__ == "__main__":
+    main()
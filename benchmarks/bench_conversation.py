@@ -0,0 +1,65 @@
+"""
+Compares the ConversationBuffer against the trim_history it replaced on long channels.
+
+Run from the repository root with `python -m benchmarks.bench_conversation`.
+"""
+import random
+import string
+
+from timeit import default_timer
+
+from bot.utils.conversation import CHARS_PER_TOKEN, ConversationBuffer
+
+
+def trim_history(history, max_chars):
+    """The list based trimming GPTRelay used before the ConversationBuffer."""
+    total_chars = sum(len(m["content"]) for m in history)
+    while total_chars > max_chars and len(history) > 1:
+        removed_message = history.pop(0)
+        total_chars -= len(removed_message["content"])
+    return history
+
+
+def generate_messages(count: int):
+    rng = random.Random(0)
+    return [
+        "".join(rng.choices(string.ascii_letters + " ", k=rng.randint(20, 800)))
+        for _ in range(count)
+    ]
+
+
+def bench_list(messages, max_chars):
+    history = [{"role": "system", "content": "You are a helpful A.I. assistant."}]
+    start = default_timer()
+    for content in messages:
+        history = trim_history(history, max_chars)
+        history.append({"role": "user", "content": content})
+    return default_timer() - start
+
+
+def bench_buffer(messages, budget):
+    buffer = ConversationBuffer("You are a helpful A.I. assistant.")
+    start = default_timer()
+    for content in messages:
+        buffer.append("user", content)
+        buffer.messages(budget)
+    return default_timer() - start
+
+
+def main():
+    print(f"{'messages':>10} {'kept':>8} {'trim_history':>14} {'buffer':>10} {'speedup':>8}")
+    for count in (1_000, 10_000, 50_000):
+        messages = generate_messages(count)
+        for kept in (50, 1_000):
+            # Budgets that hold roughly `kept` messages of the average length
+            max_chars = kept * 410
+            list_time = bench_list(messages, max_chars)
+            buffer_time = bench_buffer(messages, max_chars // CHARS_PER_TOKEN)
+            print(
+                f"{count:>10} {kept:>8} {list_time:>13.3f}s {buffer_time:>9.3f}s"
+                f" {list_time / buffer_time:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
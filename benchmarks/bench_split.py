@@ -0,0 +1,76 @@
+"""
+Compares split_long_message against the word by word splitter it replaced on
+large generated replies.
+
+Run from the repository root with `python -m benchmarks.bench_split`.
+"""
+import random
+import string
+
+from timeit import default_timer
+
+from bot.utils.text import split_long_message
+
+
+def split_by_words(message, max_length=1900):
+    """The splitter GPTRelay used before bot.utils.text."""
+    words = message.split(" ")
+    chunks = []
+    current_chunk = ""
+
+    for word in words:
+        if len(current_chunk + word + " ") > max_length:
+            chunks.append(current_chunk.strip())
+            current_chunk = word + " "
+        else:
+            current_chunk += word + " "
+
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+
+    return chunks
+
+
+def generate_reply(size: int) -> str:
+    """A reply of prose paragraphs and code blocks of roughly `size` characters."""
+    rng = random.Random(0)
+    parts = []
+    length = 0
+    while length < size:
+        if rng.random() < 0.3:
+            lines = (
+                f"    value_{i} = compute({rng.randint(0, 999)})  # step {i}"
+                for i in range(rng.randint(5, 60))
+            )
+            part = "```python\n" + "\n".join(lines) + "\n```"
+        else:
+            words = (
+                "".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 12)))
+                for _ in range(rng.randint(20, 200))
+            )
+            part = " ".join(words)
+        parts.append(part)
+        length += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def best_of(function, text, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = default_timer()
+        function(text)
+        best = min(best, default_timer() - start)
+    return best
+
+
+def main():
+    print(f"{'size':>10} {'by words':>10} {'linear':>10} {'speedup':>8}")
+    for size in (10_000, 100_000, 1_000_000, 5_000_000):
+        text = generate_reply(size)
+        old = best_of(split_by_words, text)
+        new = best_of(split_long_message, text)
+        print(f"{len(text):>10} {old:>9.4f}s {new:>9.4f}s {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares the cold start cost of finding and importing the extensions, with the
+discovery that imported every module against the one that scans their source.
+
+Every measurement runs in a fresh interpreter so nothing is already imported.
+Run from the repository root with `python -m benchmarks.bench_startup`.
+"""
+import os
+import subprocess
+import sys
+
+from statistics import median
+
+OLD_DISCOVERY = '''
+import importlib
+from os import listdir
+
+def get_extensions():
+    """The discovery bot.utils.extensions used before it scanned source."""
+    base = "./bot/exts/"
+    for subdirectory in listdir(base):
+        for file in listdir(base + subdirectory):
+            if file.startswith("_") or not file.endswith("py"):
+                continue
+            name = f"bot.exts.{subdirectory}.{file[:-3]}"
+            if not file.startswith("IO"):
+                mod = importlib.import_module(name)
+                if getattr(mod, "setup", None) is None:
+                    continue
+            yield name
+
+extensions = frozenset(get_extensions())
+'''
+
+NEW_DISCOVERY = '''
+import os
+from bot.utils.extensions import MANIFEST
+
+deferrable = os.environ.get("LAZY") == "1"
+extensions = frozenset(
+    name for name, extension in MANIFEST.items() if not (deferrable and extension.deferrable)
+)
+'''
+
+# Loading an extension imports its module, which the old discovery had already done
+TIMED = '''
+import importlib
+from time import perf_counter
+
+start = perf_counter()
+{discovery}
+print(perf_counter() - start, flush=True)
+for name in extensions:
+    importlib.import_module(name)
+print(perf_counter() - start)
+'''
+
+MODES = [
+    ("import to discover", OLD_DISCOVERY, {}, True),
+    ("scan, no manifest", NEW_DISCOVERY, {}, True),
+    ("scan, manifest", NEW_DISCOVERY, {}, False),
+    ("scan, manifest, lazy", NEW_DISCOVERY, {"LAZY": "1"}, False),
+]
+
+
+def run(discovery, env, cold_manifest):
+    if cold_manifest and os.path.exists(".extensions.json"):
+        os.remove(".extensions.json")
+    result = subprocess.run(
+        [sys.executable, "-c", TIMED.format(discovery=discovery)],
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+    )
+    times = [float(line) for line in result.stdout.split()]
+    if result.returncode:
+        # The old discovery imports as it goes, so it cannot even finish without
+        # every dependency installed
+        error = result.stderr.strip().splitlines()[-1]
+        return (times[0] if times else None), error
+    return times[0], times[1]
+
+
+def main(repeats: int = 5):
+    print(f"{'':<22} {'discovery':>10} {'to loaded':>10}")
+    for label, discovery, env, cold_manifest in MODES:
+        samples = [run(discovery, env, cold_manifest) for _ in range(repeats)]
+        found = [sample[0] for sample in samples if sample[0] is not None]
+        found = f"{median(found) * 1000:>8.1f}ms" if found else f"{'-':>10}"
+        loaded = [sample[1] for sample in samples]
+        if all(isinstance(sample, float) for sample in loaded):
+            print(f"{label:<22} {found} {median(loaded) * 1000:>8.1f}ms")
+        else:
+            error = next(sample for sample in loaded if not isinstance(sample, float))
+            print(f"{label:<22} {found} failed: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Offline load test of the GPTRelay pipeline, on_message through to the relayed reply.
+
+Synthetic messages are fed into the cog at a fixed rate across a number of channels,
+Discord is replaced by in-memory fakes and the OpenAI client is pointed at a local
+stub server with a configurable latency. Reports end-to-end latency, queue wait and
+throughput, so changes to scheduling and caching can be compared on a laptop.
+
+Run from the repository root, e.g.
+`python -m benchmarks.loadtest --rate 50 --channels 20 --duration 30 --stream`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import tempfile
+
+from aiohttp import web
+from contextlib import asynccontextmanager
+from itertools import count
+from statistics import quantiles
+from time import monotonic, perf_counter, time
+
+STUB_HOST = "127.0.0.1"
+
+
+class StubOpenAI:
+    """
+    Answers chat completions and image generations after a fixed latency.
+
+    Streamed completions send their first token after `latency` seconds and then
+    one token every `token_interval` seconds.
+    """
+
+    def __init__(self, latency: float, tokens: int, token_interval: float):
+        self.latency = latency
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.requests = 0
+
+    def reply(self) -> str:
+        return " ".join(f"token{i}" for i in range(self.tokens))
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+        await asyncio.sleep(self.latency)
+        if not body.get("stream"):
+            return web.json_response(
+                {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": int(time()),
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": self.reply()},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }
+            )
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(self.tokens):
+            chunk = {
+                "id": "stub",
+                "object": "chat.completion.chunk",
+                "created": int(time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": {"content": f"token{i} "}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(self.token_interval)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def images(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return web.json_response(
+            {"created": int(time()), "data": [{"url": "https://example.invalid/image.png"}]}
+        )
+
+    async def start(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_post("/v1/images/generations", self.images)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, STUB_HOST, 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        os.environ["OPENAI_BASE_URL"] = f"http://{STUB_HOST}:{port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        return runner
+
+
+class FakeUser:
+    def __init__(self, id: int):
+        self.id = id
+
+
+class FakeGuild:
+    def __init__(self, id: int):
+        self.id = id
+
+
+class FakeMessage:
+    ids = count(1)
+
+    def __init__(self, channel: "FakeChannel", author: FakeUser, content: str):
+        self.id = next(self.ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.attachments = []
+        self.created = perf_counter()
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    async def edit(self, **kwargs):
+        self.channel.edits += 1
+        return self
+
+
+class FakeChannel:
+    def __init__(self, id: int, guild: FakeGuild, send_latency: float):
+        self.id = id
+        self.guild = guild
+        self.name = f"gpt-{id}"
+        self.send_latency = send_latency
+        self.sends = 0
+        self.edits = 0
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self.send_latency)
+        self.sends += 1
+        return FakeMessage(self, FakeUser(0), content or "")
+
+    async def trigger_typing(self):
+        pass
+
+    @asynccontextmanager
+    async def typing(self):
+        yield
+
+
+class FakeBot:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        from bot.utils.outbound import OutboundScheduler
+
+        self.loop = loop
+        self.user = FakeUser(0)
+        self.outbound = OutboundScheduler()
+        self.cogs = {}
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        return [samples[0] if samples else 0.0] * 3
+    cuts = quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+async def run(args):
+    stub = StubOpenAI(args.latency, args.tokens, args.token_interval)
+    runner = await stub.start()
+
+    # Imported once the stub is up, so the client picks up its base URL
+    from bot.constants import DEBUG_SERVER_ID
+    from bot.exts.gpt import gpt
+
+    database = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    gpt.GPT_DATABASE = database.name
+    gpt.GPT_STREAM = args.stream
+    gpt.GPT_STREAM_EDIT_INTERVAL = args.edit_interval
+
+    loop = asyncio.get_running_loop()
+    bot = FakeBot(loop)
+    cog = gpt.GPTRelay(bot)  # type: ignore
+    bot.cogs["GPTRelay"] = cog
+    cog.debouncer.window = args.debounce
+    if not args.quotas:
+        cog.user_quota.capacity = cog.channel_quota.capacity = float("inf")
+
+    latencies = []
+    waits = []
+    process_message = cog.process_message
+
+    async def timed(messages, submitted=None):
+        if submitted is not None:
+            # The scheduler stamps submissions with the monotonic clock
+            waits.append(monotonic() - submitted)
+        await process_message(messages, submitted)
+        done = perf_counter()
+        for message in messages:
+            latencies.append(done - message.created)
+
+    cog.process_message = timed  # type: ignore
+
+    guild = FakeGuild(DEBUG_SERVER_ID)
+    channels = [FakeChannel(i, guild, args.send_latency) for i in range(1, args.channels + 1)]
+    authors = [FakeUser(i) for i in range(1, args.authors + 1)]
+    rng = random.Random(0)
+
+    sent = 0
+    start = perf_counter()
+    interval = 1 / args.rate
+    while perf_counter() - start < args.duration:
+        channel = rng.choice(channels)
+        content = "".join(rng.choices(string.ascii_lowercase + " ", k=rng.randint(10, 200)))
+        await cog.on_message(FakeMessage(channel, rng.choice(authors), content))
+        sent += 1
+        # Keep to the schedule rather than sleeping a fixed interval after each message
+        await asyncio.sleep(max(0.0, start + sent * interval - perf_counter()))
+
+    # Let the backlog drain
+    deadline = perf_counter() + args.drain
+    while (cog.scheduler.depth or len(latencies) < sent) and perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = perf_counter() - start
+
+    cog.cog_unload()
+    await asyncio.sleep(0.1)
+    await runner.cleanup()
+    os.unlink(database.name)
+
+    p50, p95, p99 = percentiles(latencies)
+    print(f"messages sent       {sent}")
+    print(f"messages answered   {len(latencies)}")
+    print(f"openai requests     {stub.requests}")
+    print(f"discord sends/edits {sum(c.sends for c in channels)}/{sum(c.edits for c in channels)}")
+    print(f"shed/rejected       {cog.scheduler.shed}/{cog.scheduler.rejected}")
+    print(f"throughput          {len(latencies) / elapsed:.1f} msg/s")
+    print(f"end to end    p50 {p50 * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms")
+    p50, p95, p99 = percentiles(waits)
+    print(f"queue wait    p50 {p50 * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rate", type=float, default=20, help="messages per second")
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--authors", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10, help="seconds to send for")
+    parser.add_argument("--drain", type=float, default=60, help="seconds to wait for the backlog")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub response latency")
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per completion")
+    parser.add_argument("--token-interval", type=float, default=0.01)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--edit-interval", type=float, default=1.0)
+    parser.add_argument("--send-latency", type=float, default=0.05, help="fake Discord send latency")
+    parser.add_argument("--debounce", type=float, default=0.0, help="debounce window")
+    parser.add_argument("--quotas", action="store_true", help="keep the admission quotas")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,7 @@ Global Constants are typed and defined here.
 Constants that doesn't need to be available throughout the library
 are defined locally where they're required.
 """
-import openai
-from typing import List
+from typing import Dict, List
 from yaml import load, SafeLoader
 from os import getenv
 from dotenv import load_dotenv
@@ -21,5 +20,61 @@ ADMINS_ID_LIST: List[int] = CONFIGURATION["bot"]["admins"]
 PREFIX: str = CONFIGURATION["bot"]["prefix"]
 DISCORD_TOKEN: str = getenv("TOKEN")
 DEBUG: bool = CONFIGURATION["bot"]["debug"]
+LAZY_EXTENSIONS: bool = CONFIGURATION["bot"]["lazy_extensions"]
+HOT_RELOAD: bool = CONFIGURATION["bot"]["hot_reload"]
+HOT_RELOAD_INTERVAL: float = CONFIGURATION["bot"]["hot_reload_interval"]
 
-openai.api_key = getenv("OPENAI_API_KEY")
+CACHE_MEMBERS: List[str] = CONFIGURATION["cache"]["members"]
+CACHE_CHUNK_GUILDS: str = CONFIGURATION["cache"]["chunk_guilds"]
+CACHE_MESSAGES: int = CONFIGURATION["cache"]["messages"]
+
+GPT_WORKERS: int = CONFIGURATION["gpt"]["workers"]
+GPT_DEBOUNCE: float = CONFIGURATION["gpt"]["debounce"]
+GPT_MAX_PENDING: int = CONFIGURATION["gpt"]["max_pending"]
+GPT_MAX_WAIT: float = CONFIGURATION["gpt"]["max_wait"]
+GPT_USER_BURST: int = CONFIGURATION["gpt"]["user_burst"]
+GPT_USER_RATE: float = CONFIGURATION["gpt"]["user_rate"]
+GPT_CHANNEL_BURST: int = CONFIGURATION["gpt"]["channel_burst"]
+GPT_CHANNEL_RATE: float = CONFIGURATION["gpt"]["channel_rate"]
+OPENAI_TIMEOUT: float = CONFIGURATION["gpt"]["timeout"]
+OPENAI_CONNECT_TIMEOUT: float = CONFIGURATION["gpt"]["connect_timeout"]
+OPENAI_MAX_CONNECTIONS: int = CONFIGURATION["gpt"]["max_connections"]
+OPENAI_MAX_KEEPALIVE: int = CONFIGURATION["gpt"]["max_keepalive_connections"]
+GPT_STREAM: bool = CONFIGURATION["gpt"]["stream"]
+GPT_STREAM_EDIT_INTERVAL: float = CONFIGURATION["gpt"]["stream_edit_interval"]
+GPT_INTENT_CACHE_SIZE: int = CONFIGURATION["gpt"]["intent_cache_size"]
+GPT_TOKEN_BUDGETS: Dict[str, int] = CONFIGURATION["gpt"]["token_budgets"]
+GPT_DATABASE: str = CONFIGURATION["gpt"]["database"]
+GPT_FLUSH_INTERVAL: float = CONFIGURATION["gpt"]["flush_interval"]
+GPT_HYDRATE_LIMIT: int = CONFIGURATION["gpt"]["hydrate_limit"]
+GPT_WORKING_SET: int = CONFIGURATION["gpt"]["working_set"]
+GPT_MEMORY_TOKENS: int = CONFIGURATION["gpt"]["memory_tokens"]
+GPT_MEMORY_BYTES: int = CONFIGURATION["gpt"]["memory_bytes"]
+GPT_IDLE_TTL: float = CONFIGURATION["gpt"]["idle_ttl"]
+GPT_IMAGE_CACHE: bool = CONFIGURATION["gpt"]["image_cache"]
+GPT_IMAGE_CACHE_TTL: float = CONFIGURATION["gpt"]["image_cache_ttl"]
+GPT_IMAGE_CACHE_SIZE: int = CONFIGURATION["gpt"]["image_cache_size"]
+GPT_ATTACHMENT_MAX_SIDE: int = CONFIGURATION["gpt"]["attachment_max_side"]
+GPT_ATTACHMENT_QUALITY: int = CONFIGURATION["gpt"]["attachment_quality"]
+GPT_ATTACHMENT_CONCURRENCY: int = CONFIGURATION["gpt"]["attachment_concurrency"]
+GPT_ATTACHMENT_CACHE_BYTES: int = CONFIGURATION["gpt"]["attachment_cache_bytes"]
+
+HTTP_LIMIT: int = CONFIGURATION["http"]["limit"]
+HTTP_LIMIT_PER_HOST: int = CONFIGURATION["http"]["limit_per_host"]
+HTTP_DNS_CACHE_TTL: int = CONFIGURATION["http"]["dns_cache_ttl"]
+HTTP_TIMEOUT: float = CONFIGURATION["http"]["timeout"]
+
+LOGS_CACHE_BYTES: int = CONFIGURATION["logs"]["cache_bytes"]
+LOGS_REFRESH_INTERVAL: float = CONFIGURATION["logs"]["refresh_interval"]
+LOGS_FETCH_CONCURRENCY: int = CONFIGURATION["logs"]["fetch_concurrency"]
+
+METRICS_ENABLED: bool = CONFIGURATION["metrics"]["enabled"]
+METRICS_HOST: str = CONFIGURATION["metrics"]["host"]
+METRICS_PORT: int = CONFIGURATION["metrics"]["port"]
+
+SAMPLER_INTERVAL: float = CONFIGURATION["sampler"]["interval"]
+SAMPLER_HISTORY: float = CONFIGURATION["sampler"]["history"]
+
+WATCHDOG_ENABLED: bool = CONFIGURATION["watchdog"]["enabled"]
+WATCHDOG_THRESHOLD: float = CONFIGURATION["watchdog"]["threshold"]
+WATCHDOG_MAX_REPORTS: int = CONFIGURATION["watchdog"]["max_reports"]
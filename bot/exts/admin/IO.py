@@ -1,23 +1,69 @@
-import psutil
-
 from discord.ext import commands
 from discord.commands import slash_command
 from discord.commands.context import ApplicationContext
 from discord import Embed
 from discord.commands.options import Option
 from discord.utils import format_dt
+from time import perf_counter
+from typing import List
 
 from bot.utils.checks import is_admin
 from bot.utils.extensions import EXTENSIONS
-from bot.constants import DEBUG_SERVER_ID
+from bot.utils.metrics import REGISTRY, Histogram
+from bot.utils.reloader import ExtensionWatcher, Reload, reload_extensions
+from bot.constants import DEBUG_SERVER_ID, HOT_RELOAD, HOT_RELOAD_INTERVAL
 
 
 OPT_EXTS = [e.split('.')[-1] for e in EXTENSIONS]
+# What /sysinf shows the history of, as the field name, the sample field and the
+# scale from the sample's unit
+SYSTEM_METRICS = [
+    ("CPU %", "cpu", 1),
+    ("RAM %", "memory", 1),
+    ("RSS MiB", "rss", 1 / 2**20),
+    ("Sockets", "sockets", 1),
+    ("Tasks", "tasks", 1),
+    ("Loop lag ms", "lag", 1000),
+]
+WINDOWS = [("1m", 60), ("5m", 300), ("15m", 900)]
+
+def format_reloads(reloads: List[Reload]) -> str:
+    """
+    A table of how long each extension took to reload, followed by the errors of
+    those that failed.
+    """
+    rows = [
+        f"{'❎' if reload.error else '☑️'} {reload.extension.split('.')[-1]:<12}{reload.seconds * 1000:>8.1f} ms"
+        for reload in reloads
+    ]
+    errors = [f"{reload.extension}: {reload.error}" for reload in reloads if reload.error]
+    table = "```" + "\n".join(rows) + "```"
+    if errors:
+        table += "```" + "\n".join(errors)[:1500] + "```"
+    return table
+
 
 class AdminIO(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.extension_state = []
+        self.watcher = None
+        if HOT_RELOAD:
+            self.watcher = ExtensionWatcher(EXTENSIONS, HOT_RELOAD_INTERVAL, self.reload_changed)
+            self.watcher.start(bot.loop)
+
+    def cog_unload(self):
+        if self.watcher is not None:
+            self.watcher.close()
+
+    async def reload_changed(self, extensions: List[str]):
+        # Extensions that are not loaded, deferred or unloaded, stay that way
+        loaded = [ext for ext in extensions if ext in self.bot.extensions]
+        for reload in await reload_extensions(self.bot, loaded):
+            if reload.error:
+                print(f"Failed to reload {reload.extension}: {reload.error}")
+            else:
+                print(f"Reloaded {reload.extension} in {reload.seconds * 1000:.1f} ms")
 
     @slash_command(name="load", guild_ids=(DEBUG_SERVER_ID,))
     @commands.check(is_admin)
@@ -41,17 +87,45 @@ class AdminIO(commands.Cog):
             + f" [{percent * 100}%]"
         )
 
+    def get_sparkline(self, values, levels="⣀⣤⣶⣿"):
+        """
+        Get the shape of a series of values over 20 columns, drawn with the
+        characters of the progress bar, each column showing the peak it covers.
+        """
+        if not values:
+            return ""
+        columns = min(20, len(values))
+        peaks = [
+            max(values[i * len(values) // columns : (i + 1) * len(values) // columns])
+            for i in range(columns)
+        ]
+        top = max(peaks) or 1
+        return (
+            "".join(levels[round(peak / top * (len(levels) - 1))] for peak in peaks)
+            + f" [{max(peaks):g}]"
+        )
+
+    def get_history(self, sampler, field, scale):
+        """
+        Get a sparkline of the last 15 minutes of a sampled field followed by its
+        min, average and 95th percentile over each window.
+        """
+        longest = WINDOWS[-1][1]
+        values = [round(getattr(sample, field) * scale, 1) for sample in sampler.window(longest)]
+        rows = [self.get_sparkline(values), f"{'':<4}{'min':>8}{'avg':>8}{'p95':>8}"]
+        for label, seconds in WINDOWS:
+            summary = sampler.summary(field, seconds)
+            if summary is not None:
+                low, mean, p95 = (value * scale for value in summary)
+                rows.append(f"{label:<4}{low:>8.1f}{mean:>8.1f}{p95:>8.1f}")
+        return "```" + "\n".join(rows) + "```"
+
     @slash_command(name="sysinf", guild_ids=(DEBUG_SERVER_ID,))
     @commands.check(is_admin)
     async def uptime(self, ctx: ApplicationContext):
         """
         View host system information.
         """
-        cpu_percent = psutil.cpu_percent()
-        ram_percent = psutil.virtual_memory().percent
-
-        cpu_usage = self.get_progress_bar(cpu_percent / 100, "⣿", "⣀")
-        ram_usage = self.get_progress_bar(ram_percent / 100, "⣿", "⣀")
         embed = (
             Embed(title="Contemporary Info")
             .set_author(name="SYSTEM INFORMATION")
@@ -60,11 +134,86 @@ class AdminIO(commands.Cog):
                 value=f"{format_dt(self.bot.active_since, 'F')}"
                 f"\n{format_dt(self.bot.active_since, 'R')}",
             )
-            .add_field(name="CPU", value=f"```{cpu_usage}```", inline=False)
-            .add_field(name="RAM", value=f"```{ram_usage}```", inline=False)
         )
+
+        # Sampled in the background, so the numbers cover the whole interval
+        # rather than whatever happened since the last /sysinf
+        sampler = self.bot.sampler
+        latest = sampler.latest
+        if latest is None:
+            embed.add_field(name="System", value="Collecting samples, try again shortly.", inline=False)
+        else:
+            cpu_usage = self.get_progress_bar(latest.cpu / 100, "⣿", "⣀")
+            ram_usage = self.get_progress_bar(latest.memory / 100, "⣿", "⣀")
+            embed.add_field(name="CPU", value=f"```{cpu_usage}```", inline=False)
+            embed.add_field(name="RAM", value=f"```{ram_usage}```", inline=False)
+            for name, field, scale in SYSTEM_METRICS:
+                embed.add_field(name=name, value=self.get_history(sampler, field, scale))
+
+        gpt = self.bot.get_cog("GPTRelay")
+        if gpt is not None:
+            usage = gpt.conversation_history.usage()  # type: ignore
+            embed.add_field(
+                name="Conversations",
+                value=f"```{usage['channels']} channels · {usage['messages']} messages"
+                f"\n{usage['tokens']} tokens · {usage['bytes'] / 1024:.1f} KiB"
+                f"\n{usage['evictions']} evicted · {usage['expirations']} expired```",
+                inline=False,
+            )
+            embed.add_field(
+                name="GPT Queue",
+                value=f"```{gpt.scheduler.depth} pending · {gpt.scheduler.shed} shed"  # type: ignore
+                f"\n{gpt.scheduler.rejected} rejected · {gpt.throttled} throttled```",  # type: ignore
+                inline=False,
+            )
+            intent = gpt.image_intent  # type: ignore
+            rates = intent.hit_rates()
+            embed.add_field(
+                name="Image Intent",
+                value=f"```{sum(intent.stats.values())} prompts"
+                f"\n{rates['local']:.0%} local · {rates['cache']:.0%} cached"
+                f"\n{rates['remote']:.0%} remote · {rates['failed']:.0%} failed```",
+                inline=False,
+            )
+
+        latencies = [
+            f"{labels['stage']:<18}{stage.count:>6} {stage.mean() * 1000:>8.1f} {stage.quantile(0.95) * 1000:>8.0f}"
+            for labels, stage in REGISTRY.children("bot_stage_seconds")
+            if isinstance(stage, Histogram) and stage.count
+        ]
+        if latencies:
+            embed.add_field(
+                name="Latency (ms)",
+                value=f"```{'stage':<18}{'n':>6} {'avg':>8} {'p95':>8}\n"
+                + "\n".join(latencies)
+                + "```",
+                inline=False,
+            )
         await ctx.respond(embed=embed)
 
+    @slash_command(name="loop-stalls", guild_ids=(DEBUG_SERVER_ID,))
+    @commands.check(is_admin)
+    async def loop_stalls(self, ctx: ApplicationContext):
+        """
+        View what held the event loop up the longest.
+        """
+        watchdog = self.bot.watchdog
+        stalls = watchdog.report()
+        embed = Embed(
+            title="Loop Stalls",
+            description=f"{watchdog.stalls} stalls over {watchdog.threshold * 1000:.0f} ms"
+            f" · worst {watchdog.worst * 1000:.0f} ms",
+        )
+        for stall in stalls[:5]:
+            # The innermost frames are the ones that were blocking
+            stack = "".join(stall.stack[-4:])[-900:]
+            embed.add_field(
+                name=f"{stall.worst * 1000:.0f} ms worst · {stall.count}x · {stall.culprit}"[:256],
+                value=f"```{stack}```",
+                inline=False,
+            )
+        await ctx.respond(embed=embed, ephemeral=True)
+
     @slash_command(name="unload", guild_ids=(DEBUG_SERVER_ID,))
     @commands.check(is_admin)
     async def unload_cog(
@@ -94,11 +243,8 @@ class AdminIO(commands.Cog):
         """
         for ext in EXTENSIONS:
             if ext.split(".")[-1] == extension:
-                try:
-                    self.bot.reload_extension(ext)
-                except:
-                    pass
-                await ctx.respond("☑️", ephemeral=True)
+                reloads = await reload_extensions(self.bot, [ext])
+                await ctx.respond(format_reloads(reloads), ephemeral=True)
                 return
         await ctx.respond("❎", ephemeral=True)
 
@@ -108,19 +254,14 @@ class AdminIO(commands.Cog):
         """
         Reloads every cog connected to the bot.
         """
-        faulty = ""
-        excep = None
-        for ext in EXTENSIONS:
-            try:
-                self.bot.reload_extension(ext)
-            except Exception as e:
-                excep = e
-                faulty += f"\n`{ext}`"
-        if excep:
-            await ctx.respond(f"❎ {faulty}", ephemeral=True)
-            raise excep
-        else:
-            await ctx.respond("☑️", ephemeral=True)
+        await ctx.defer(ephemeral=True)
+        loaded = [ext for ext in EXTENSIONS if ext in self.bot.extensions]
+        start = perf_counter()
+        reloads = await reload_extensions(self.bot, loaded)
+        await ctx.respond(
+            f"Reloaded in {(perf_counter() - start) * 1000:.1f} ms" + format_reloads(reloads),
+            ephemeral=True,
+        )
 
 
 def setup(bot):
@@ -1,76 +1,230 @@
-import openai
 import discord
 import asyncio
 
 from discord.commands import slash_command
-from asyncio import sleep
 from discord.ext import commands
+from collections import Counter
+from functools import partial
+from time import monotonic
+from typing import List, Optional
 from traceback import print_exc
-from bot.constants import DEBUG_SERVER_ID, SEC_DEBUG_SERVER_ID
-
-MAX_HISTORY_CHARS = 6000
-
-
-def split_long_message(message, max_length=1900):
-    """Split a long message into chunks that respect word boundaries and new lines, with a specified max length."""
-    words = message.split(" ")
-    chunks = []
-    current_chunk = ""
-
-    for word in words:
-        # Check if adding the next word would exceed the max_length
-        if len(current_chunk + word + " ") > max_length:
-            # If it does, add the current chunk to chunks and start a new chunk
-            chunks.append(current_chunk.strip())
-            current_chunk = word + " "
-        else:
-            # If not, add the word to the current chunk
-            current_chunk += word + " "
-
-    # Add the last chunk if it's not empty
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-
-    return chunks
-
-
-def trim_history(history, max_chars=MAX_HISTORY_CHARS):
-    """Trim the history to be within the max character limit."""
-    total_chars = sum(len(m["content"]) for m in history)
-    while total_chars > max_chars and len(history) > 1:
-        removed_message = history.pop(0)
-        total_chars -= len(removed_message["content"])
-    return history
-
-
-ALLOWED_MIME_TYPES = ["image/png", "image/jpeg", "image/gif"]
+from bot.constants import (
+    DEBUG_SERVER_ID,
+    SEC_DEBUG_SERVER_ID,
+    GPT_WORKERS,
+    GPT_DEBOUNCE,
+    GPT_MAX_PENDING,
+    GPT_MAX_WAIT,
+    GPT_USER_BURST,
+    GPT_USER_RATE,
+    GPT_CHANNEL_BURST,
+    GPT_CHANNEL_RATE,
+    OPENAI_TIMEOUT,
+    OPENAI_CONNECT_TIMEOUT,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE,
+    GPT_STREAM,
+    GPT_STREAM_EDIT_INTERVAL,
+    GPT_INTENT_CACHE_SIZE,
+    GPT_TOKEN_BUDGETS,
+    GPT_DATABASE,
+    GPT_FLUSH_INTERVAL,
+    GPT_HYDRATE_LIMIT,
+    GPT_WORKING_SET,
+    GPT_MEMORY_TOKENS,
+    GPT_MEMORY_BYTES,
+    GPT_IDLE_TTL,
+    GPT_IMAGE_CACHE,
+    GPT_IMAGE_CACHE_TTL,
+    GPT_IMAGE_CACHE_SIZE,
+    GPT_ATTACHMENT_MAX_SIDE,
+    GPT_ATTACHMENT_QUALITY,
+    GPT_ATTACHMENT_CONCURRENCY,
+    GPT_ATTACHMENT_CACHE_BYTES,
+)
+from bot.utils.attachments import AttachmentPipeline, UnsupportedAttachment
+from bot.utils.cache import AsyncTTLCache
+from bot.utils.conversation import (
+    Content,
+    ConversationBuffer,
+    ConversationCache,
+    load_tokenizer,
+)
+from bot.utils.debounce import Debouncer
+from bot.utils.intent import ImageIntentClassifier
+from bot.utils.metrics import counter, histogram
+from bot.utils.ratelimit import KeyedTokenBuckets
+from bot.utils.scheduler import ChannelScheduler
+from bot.utils.store import ConversationStore
+from bot.utils.text import CLOSE_FENCE, find_break, open_fence, split_long_message
+
+MAX_MESSAGE_CHARS = 1900
 GPT_IMAGE_MODELS = ["dall-e-3"]
 
+STAGE_HELP = "Seconds spent in each stage of the bot's pipelines."
+FILTER_SECONDS = histogram("bot_stage_seconds", STAGE_HELP, stage="on_message_filter")
+QUEUE_WAIT_SECONDS = histogram("bot_stage_seconds", STAGE_HELP, stage="queue_wait")
+MODEL_SECONDS = histogram("bot_stage_seconds", STAGE_HELP, stage="determine_model")
+OPENAI_SECONDS = histogram("bot_stage_seconds", STAGE_HELP, stage="openai")
+RELAY_SECONDS = histogram("bot_stage_seconds", STAGE_HELP, stage="relay_response")
+MESSAGES_HELP = "GPT relay messages by outcome."
+RELAYED = counter("gpt_messages_total", MESSAGES_HELP, outcome="relayed")
+THROTTLED = counter("gpt_messages_total", MESSAGES_HELP, outcome="throttled")
+ANSWERED = counter("gpt_messages_total", MESSAGES_HELP, outcome="answered")
+FAILED = counter("gpt_messages_total", MESSAGES_HELP, outcome="failed")
+
 
 class GPTRelay(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.conversation_history = {}
-        self.openai_client = openai.OpenAI()
+        self.conversation_history = ConversationCache(
+            max_channels=GPT_WORKING_SET,
+            max_tokens=GPT_MEMORY_TOKENS,
+            max_bytes=GPT_MEMORY_BYTES,
+            idle_ttl=GPT_IDLE_TTL,
+        )
+        self.store = ConversationStore(GPT_DATABASE, flush_interval=GPT_FLUSH_INTERVAL)
+        self.store.start(self.bot.loop)
+        # Bumped by /clear-gpt, so that answers already under way are not remembered
+        self.generations: Counter = Counter()
+        self.bot.loop.create_task(asyncio.to_thread(self.warm_up))
+        self._openai_client = None
         self.allowed_dm = [705000432518430720, 368671236370464769]
         self.system_message = "You are a helpful A.I. assistant."
+        self.image_intent = ImageIntentClassifier(
+            self.is_dalle_prompt, cache_size=GPT_INTENT_CACHE_SIZE
+        )
+        self.image_cache = AsyncTTLCache(GPT_IMAGE_CACHE_TTL, GPT_IMAGE_CACHE_SIZE)
+        self.attachments = AttachmentPipeline(
+            max_side=GPT_ATTACHMENT_MAX_SIDE,
+            quality=GPT_ATTACHMENT_QUALITY,
+            concurrency=GPT_ATTACHMENT_CONCURRENCY,
+            cache_bytes=GPT_ATTACHMENT_CACHE_BYTES,
+        )
 
-        self.queue = asyncio.Queue()
-        self.bot.loop.create_task(self.queue_worker())
-
-    async def determine_model(self, message):
-        if message.attachments:
+        self.scheduler = ChannelScheduler(
+            workers=GPT_WORKERS, max_pending=GPT_MAX_PENDING, max_wait=GPT_MAX_WAIT
+        )
+        self.scheduler.start(self.bot.loop)
+        # Quick successive messages of an author are answered as one
+        self.debouncer = Debouncer(GPT_DEBOUNCE, self.dispatch)
+
+        # Admission control
+        self.user_quota = KeyedTokenBuckets(GPT_USER_BURST, GPT_USER_RATE)
+        self.channel_quota = KeyedTokenBuckets(GPT_CHANNEL_BURST, GPT_CHANNEL_RATE)
+        self.busy_notices = KeyedTokenBuckets(1, 1 / 30)
+        self.throttled = 0
+
+    def cog_unload(self):
+        self.debouncer.close()
+        self.scheduler.close()
+        self.attachments.close()
+        if self._openai_client is not None:
+            self.bot.loop.create_task(self._openai_client.close())
+        self.store.close()
+
+    @staticmethod
+    def warm_up():
+        """
+        Does the slow imports and loads before the first message needs them, meant to
+        run in a worker thread. Token counts are estimated from the length of the
+        text until the tokenizer is loaded.
+        """
+        import openai  # noqa: F401
+
+        load_tokenizer()
+
+    @property
+    def openai_client(self):
+        """
+        One pooled connection that every call of the cog shares, none of them
+        block the event loop. The SDK is slow to import, warm_up imports it in a
+        thread ahead of the first client being created.
+        """
+        if self._openai_client is None:
+            import httpx
+            import openai
+
+            self._openai_client = openai.AsyncOpenAI(
+                timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+                http_client=openai.DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                    ),
+                ),
+            )
+        return self._openai_client
+
+    async def get_history(self, channel_id: int) -> ConversationBuffer:
+        """
+        The conversation of a channel, loaded from the store when the channel first
+        becomes active or after it was evicted from memory.
+        """
+        history = self.conversation_history.get(channel_id)
+        if history is not None:
+            return history
+
+        generation = self.generations[channel_id]
+        history = ConversationBuffer(self.system_message)
+        for role, content in await self.store.load(channel_id, GPT_HYDRATE_LIMIT):
+            history.append(role, content)
+        # Kept only if the channel was not cleared while it was loading
+        if generation == self.generations[channel_id]:
+            self.conversation_history.put(channel_id, history)
+        return history
+
+    def remember(
+        self, channel_id: int, role: str, content: Content, generation: Optional[int] = None
+    ):
+        """
+        Adds a message to the conversation of a channel and queues it to be stored.
+
+        :param generation: the generation of the channel when the message was made,
+        it is dropped if the channel has been cleared since
+        """
+        if generation is not None and generation != self.generations[channel_id]:
+            return
+        history = self.conversation_history.get(channel_id)
+        if history is not None:
+            history.append(role, content)
+            self.conversation_history.enforce()
+        self.store.append(channel_id, role, content)
+
+    async def determine_model(self, prompt: str, attachments: List[discord.Attachment]):
+        if attachments:
             model = "gpt-4o"
-        elif await self.is_dalle_prompt(message.content):
-            model = "dall-e-3"
+        elif await self.image_intent.classify(prompt):
+            model = GPT_IMAGE_MODELS[0]
         else:
             model = "gpt-4o"
 
         return model
 
-    async def is_dalle_prompt(self, prompt: str):
+    async def generate_image(self, **kwargs):
+        """
+        Generates an image, through the image cache if it is enabled.
+
+        Generations are keyed by the normalized prompt and every other parameter, so
+        identical prompts that arrive at the same time share one generation.
+        """
+        if not GPT_IMAGE_CACHE:
+            return await self.openai_client.images.generate(**kwargs)
+
+        key = (
+            " ".join(kwargs["prompt"].lower().split()),
+            *sorted((k, v) for k, v in kwargs.items() if k != "prompt"),
+        )
+        return await self.image_cache.get_or_create(
+            key, partial(self.openai_client.images.generate, **kwargs)
+        )
+
+    async def is_dalle_prompt(self, prompt: str) -> Optional[bool]:
+        """
+        Asks a small model whether a prompt wants an image, None if the call failed.
+        """
         try:
-            response = self.openai_client.chat.completions.create(
+            response = await self.openai_client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
                     {
@@ -85,47 +239,172 @@ class GPTRelay(commands.Cog):
             )
         except Exception:
             print_exc()
+            return None
+        answer = response.choices[0].message.content or ""
+        return answer.strip().strip(".!").lower() == "yes"
+
+    async def create_content(
+        self,
+        message: discord.Message,
+        prompt: str,
+        attachments: List[discord.Attachment],
+    ):
+        if attachments:
+            try:
+                images = await self.attachments.prepare(attachments)
+            except UnsupportedAttachment as e:
+                await self.reply_error(
+                    message,
+                    "Bad File Upload",
+                    f"The file uploaded '{e.filename}' is {e.reason}.",
+                )
+                return
+            content = [{"type": "text", "text": prompt}]
+            for url in images:
+                content.append(
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": url,
+                        },
+                    }
+                )
         else:
-            return response.choices[0].message.content.lower() == "yes"
-        return False
-
-    async def create_content(self, message):
-        if message.attachments:
-            content = [{"type": "text", "text": message.content}]
-            for file in message.attachments:
-                if not file.content_type in ALLOWED_MIME_TYPES:
-                    await self.reply_error(
-                        message,
-                        "Bad File Upload",
-                        f"The file uploaded '{file.filename}' is not an accepted file type.",
-                    )
-                    return
-                else:
-                    content.append(
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": file.url,
-                            },
-                        }
-                    )
-        else:
-            content = message.content
+            content = prompt
 
         return content
 
     async def relay_response(self, message: discord.Message, model: str, response: str):
-        message_parts = split_long_message(response)
-
-        for part in message_parts:
-            if part == message_parts[-1]:
-                part += f"\n\n`> Model: {model} · System: {self.system_message}`"
+        message_parts = split_long_message(response, MAX_MESSAGE_CHARS) or [""]
+        message_parts[-1] += f"\n\n`> Model: {model} · System: {self.system_message}`"
+
+        # Queue every part at once, the outbound scheduler sends them back to back
+        await asyncio.gather(
+            *(
+                self.bot.outbound.send(  # type: ignore
+                    message.channel,
+                    part,
+                    **({"reference": message, "mention_author": False} if index == 0 else {}),
+                )
+                for index, part in enumerate(message_parts)
+            )
+        )
 
-            if part == message_parts[0]:
-                await message.reply(part, mention_author=False)
+    async def relay_stream(self, message: discord.Message, model: str, stream) -> str:
+        """
+        Relays a streamed completion as it arrives and returns the full reply.
+
+        The reply is posted with the first tokens and then edited at most once every
+        GPT_STREAM_EDIT_INTERVAL seconds to stay inside Discord's edit rate limits.
+        Once a message is full, the stream rolls over into a new one, and a code
+        fence that is open there is closed and reopened with its language.
+        """
+        footer = f"\n\n`> Model: {model} · System: {self.system_message}`"
+        reply = ""
+        start = 0  # where the message that is being edited starts in the reply
+        language = None  # the language of the fence open at `start`
+        sent = None
+        posted = 0
+        last_edit = 0.0
+
+        async def show(content: str):
+            nonlocal sent, posted
+            if sent is None:
+                # Kept to be edited, so never shared with another send
+                if posted == 0:
+                    sent = await self.bot.outbound.send(  # type: ignore
+                        message.channel,
+                        content,
+                        coalesce=False,
+                        reference=message,
+                        mention_author=False,
+                    )
+                else:
+                    sent = await self.bot.outbound.send(  # type: ignore
+                        message.channel, content, coalesce=False
+                    )
+                posted += 1
             else:
-                await message.channel.send(part)
-            await sleep(0.5)
+                await sent.edit(content=content)
+
+        def render(end: int, footer: str = "") -> str:
+            prefix = "" if language is None else f"```{language}\n"
+            body = prefix + reply[start:end].rstrip()
+            return body + ("" if open_fence(reply, start, end, language) is None else CLOSE_FENCE) + footer
+
+        async def roll_over():
+            nonlocal sent, start, language
+            while True:
+                prefix = 0 if language is None else len(language) + 4
+                end = start + MAX_MESSAGE_CHARS - prefix - len(CLOSE_FENCE)
+                if len(reply) <= end:
+                    return
+                cut, skip = find_break(reply, start, end)
+                await show(render(cut))
+                sent = None
+                language = open_fence(reply, start, cut, language)
+                start = cut + skip
+
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            reply += chunk.choices[0].delta.content
+
+            if monotonic() - last_edit < GPT_STREAM_EDIT_INTERVAL:
+                continue
+            await roll_over()
+            if reply[start:].strip():
+                await show(render(len(reply)))
+                last_edit = monotonic()
+
+        await roll_over()
+        await show(render(len(reply), footer))
+        return reply
+
+    async def reply_busy(self, message: discord.Message):
+        """
+        Tells the channel that its message was shed, at most once every 30 seconds.
+        """
+        if self.busy_notices.take(message.channel.id):
+            await self.bot.outbound.send(  # type: ignore
+                message.channel,
+                "⏳ I'm swamped right now, try again in a bit.",
+                reference=message,
+                mention_author=False,
+            )
+
+    def admit(self, message: discord.Message) -> bool:
+        """
+        Takes a token from the quotas of the author and the channel if both have one.
+        """
+        user = self.user_quota.bucket(message.author.id)
+        channel = self.channel_quota.bucket(message.channel.id)
+        if user.available() < 1 or channel.available() < 1:
+            self.throttled += 1
+            return False
+        user.take()
+        channel.take()
+        return True
+
+    def dispatch(self, channel_id: int, messages: List[discord.Message]):
+        """
+        Hands a burst of messages to the scheduler, or sheds it if too many are pending.
+
+        The quotas are charged here, once per burst, since a burst is answered
+        with a single completion however many messages it is made of.
+        """
+        if not self.admit(messages[-1]):
+            THROTTLED.inc()
+            self.bot.loop.create_task(self.reply_busy(messages[-1]))
+            return
+
+        admitted = self.scheduler.submit(
+            channel_id,
+            partial(self.process_message, messages, monotonic()),
+            shed=partial(self.reply_busy, messages[-1]),
+        )
+        if not admitted:
+            self.bot.loop.create_task(self.reply_busy(messages[-1]))
 
     async def reply_error(self, message: discord.Message, title: str, error: str):
         embed = discord.Embed(
@@ -133,80 +412,112 @@ class GPTRelay(commands.Cog):
             description=f"An error occurred: {error}",
             color=discord.Color.red(),
         )
-        await message.reply(embed=embed)
+        await self.bot.outbound.send(message.channel, embed=embed, reference=message)  # type: ignore
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
+    def is_relayed(self, message: discord.Message) -> bool:
         if message.author == self.bot.user:
-            return
+            return False
 
         if message.guild:
             if message.guild.id not in [DEBUG_SERVER_ID, SEC_DEBUG_SERVER_ID]:
-                return
+                return False
 
             if "gpt" not in message.channel.name:  # type: ignore
-                return
+                return False
         else:
             if message.author.id not in self.allowed_dm:
-                return
+                return False
 
-        await self.queue.put(self.process_message(message))
+        return True
 
-    async def queue_worker(self):
-        """A worker that processes tasks from the queue."""
-        while True:
-            task = await self.queue.get()
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        with FILTER_SECONDS.time():
+            relayed = self.is_relayed(message)
+        if not relayed:
+            return
+
+        RELAYED.inc()
+        if self.debouncer.add(message.channel.id, message.author.id, message):
+            # Typing is shown from the first message of a burst, not once it is flushed
             try:
-                await task
-            finally:
-                self.queue.task_done()
+                await message.channel.trigger_typing()
+            except discord.HTTPException:
+                pass
+
+    async def process_message(
+        self, messages: List[discord.Message], submitted: Optional[float] = None
+    ):
+        """
+        Answers a burst of messages from one author as a single user turn.
+
+        :param submitted: when the burst was handed to the scheduler, if it was
+        """
+        # Imported in a thread by warm_up when the cog was created, so this is a lookup
+        # unless the first message beat it
+        import openai
+
+        if submitted is not None:
+            QUEUE_WAIT_SECONDS.observe(monotonic() - submitted)
+
+        message = messages[-1]
+        generation = self.generations[message.channel.id]
+        prompt = "\n".join(m.content for m in messages if m.content)
+        attachments = [file for m in messages for file in m.attachments]
 
-    async def process_message(self, message: discord.Message):
         async with message.channel.typing():
-            model = await self.determine_model(message)
+            with MODEL_SECONDS.time():
+                model = await self.determine_model(prompt, attachments)
 
         if model in GPT_IMAGE_MODELS:
-            runner = self.openai_client.images.generate
+            runner = self.generate_image
             kwargs = {
                 "model": model,
-                "prompt": message.content,
+                "prompt": prompt,
                 "size": "1024x1024",
                 "quality": "standard",
                 "n": 1,
             }
         else:
-            # prepare a trimmed history of the conversation
-            channel_history = trim_history(
-                self.conversation_history.get(
-                    message.channel.id,
-                    [{"role": "system", "content": self.system_message}],
-                )
-            )
-            content = await self.create_content(message)
+            content = await self.create_content(message, prompt, attachments)
             if content is None:
                 return
-            channel_history.append({"role": "user", "content": content})
+            channel_history = await self.get_history(message.channel.id)
+            self.remember(message.channel.id, "user", content, generation)
 
             runner = self.openai_client.chat.completions.create
             kwargs = {
                 "model": model,
-                "messages": channel_history,
+                # prepare a trimmed history of the conversation
+                "messages": channel_history.messages(
+                    GPT_TOKEN_BUDGETS.get(model, GPT_TOKEN_BUDGETS["default"])
+                ),
                 "max_tokens": 500,
+                "stream": GPT_STREAM,
             }
 
         async with message.channel.typing():
             try:
-                response = runner(**kwargs)
-
-                if kwargs["model"] in GPT_IMAGE_MODELS:
-                    await message.reply(response.data[0].url, mention_author=False)
-                else:
-                    reply = response.choices[0].message.content
-                    await self.relay_response(message, model, reply)  # type: ignore
-                    if message.channel.id in self.conversation_history:
-                        self.conversation_history[message.channel.id].append(
-                            {"role": "assistant", "content": reply}
+                # For streams this is the time until the response starts
+                with OPENAI_SECONDS.time():
+                    response = await runner(**kwargs)
+
+                with RELAY_SECONDS.time():
+                    if kwargs["model"] in GPT_IMAGE_MODELS:
+                        await self.bot.outbound.send(  # type: ignore
+                            message.channel,
+                            response.data[0].url,
+                            reference=message,
+                            mention_author=False,
                         )
+                    else:
+                        if GPT_STREAM:
+                            reply = await self.relay_stream(message, model, response)
+                        else:
+                            reply = response.choices[0].message.content
+                            await self.relay_response(message, model, reply)  # type: ignore
+                        self.remember(message.channel.id, "assistant", reply, generation)
+                ANSWERED.inc()
 
             except openai.BadRequestError as e:
                 await self.reply_error(
@@ -214,6 +525,7 @@ class GPTRelay(commands.Cog):
                     "Bad Request",
                     "There was an issue with the request to OpenAI. Please check the API key and try again.",
                 )
+                FAILED.inc()
                 print(f"InvalidRequestError: {e}")
 
             except openai.OpenAIError as e:
@@ -222,6 +534,7 @@ class GPTRelay(commands.Cog):
                     "OpenAI Service Error",
                     "An error occurred with the OpenAI service.",
                 )
+                FAILED.inc()
                 print(f"OpenAIError: {e}")
 
             except Exception as e:
@@ -230,13 +543,15 @@ class GPTRelay(commands.Cog):
                     "Unexpected Error",
                     "An unexpected error occurred.",
                 )
+                FAILED.inc()
                 print_exc()
 
     @slash_command(name="clear-gpt", guild_ids=(DEBUG_SERVER_ID, SEC_DEBUG_SERVER_ID))
     async def clearhistory(self, ctx):
         """Clears the conversation history for the channel."""
-        if ctx.channel.id in self.conversation_history:
-            del self.conversation_history[ctx.channel.id]
+        self.generations[ctx.channel.id] += 1
+        self.conversation_history.pop(ctx.channel.id)
+        if await self.store.clear(ctx.channel.id):
             await ctx.respond("Conversation history cleared.")
         else:
             await ctx.respond("No conversation history to clear.")
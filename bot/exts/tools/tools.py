@@ -1,52 +1,130 @@
+import asyncio
+import re
+
 from discord.commands import slash_command
 from discord.ext import commands
 from discord import ApplicationContext, File
-import string
+from discord.commands.options import Option
 from os import path, getenv
-from io import StringIO
-from bot.constants import DEBUG_SERVER_ID
-from cloudflare import AsyncCloudflare
+from typing import Dict
+from bot.constants import (
+    DEBUG_SERVER_ID,
+    LOGS_CACHE_BYTES,
+    LOGS_FETCH_CONCURRENCY,
+    LOGS_REFRESH_INTERVAL,
+)
+from bot.utils.logs import (
+    CachedLog,
+    DeploymentLogCache,
+    build_log_file,
+    filter_entries,
+    merge_logs,
+    parse_since,
+)
+from bot.utils.metrics import histogram
 
-printable = ["▲", *string.printable, "⚡️"]
+FETCH_SECONDS = histogram(
+    "bot_stage_seconds",
+    "Seconds spent in each stage of the bot's pipelines.",
+    stage="show_logs_fetch",
+)
+LINK_SEPARATORS = re.compile(r"[\s,]+")
 
 
-def remove_ascii_codes(text):
-    """
-    Removes ASCII codes from text while preserving readable characters.
+class Tools(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._client = None
+        self.logs = DeploymentLogCache(LOGS_CACHE_BYTES, LOGS_REFRESH_INTERVAL)
+        self.fetches = asyncio.Semaphore(LOGS_FETCH_CONCURRENCY)
+        self.fetching: Dict[str, "asyncio.Task[CachedLog]"] = {}
 
-    Args:
-        text (str): Input text containing ASCII codes
+    @property
+    def client(self):
+        # The Cloudflare SDK is slow to import and only /show-logs needs it
+        if self._client is None:
+            from cloudflare import AsyncCloudflare
 
-    Returns:
-        str: Cleaned text with ASCII codes removed
-    """
-    cleaned_text = "".join(char for char in text if char in printable)
-    return cleaned_text
+            self._client = AsyncCloudflare()
+        return self._client
 
+    async def fetch_log(self, project_name: str, deployment_id: str) -> CachedLog:
+        """
+        The filtered log of a deployment, fetched again unless the cached copy is fresh.
 
-class Tools(commands.Cog):
-    def __init__(self, bot: commands.Bot):
-        self.bot = bot
-        self.client = AsyncCloudflare()
+        Commands that want the same deployment at once share a single fetch.
+        """
+        log = self.logs.get(deployment_id)
+        if self.logs.is_fresh(log):
+            return log
 
-    @slash_command(name="show-logs", guild_ids=(DEBUG_SERVER_ID,))
-    async def show_logs(self, ctx: ApplicationContext, project_name: str, link: str):
-        deployment_id = path.basename(link)
-        logs: dict = await self.client.pages.projects.deployments.history.logs.get(
-            deployment_id,
-            account_id=getenv("CLOUDFLARE_ACCOUNT_ID"),
-            project_name=project_name,
-        )  # type: ignore
-
-        data = StringIO(
-            "\n".join(
-                f"{l['ts']}\t{remove_ascii_codes(l['line'])}"
-                for l in logs["data"]
-                if any(a in l["line"] for a in ["WARN", "▲", "⚡️"])
+        task = self.fetching.get(deployment_id)
+        if task is None:
+            task = self.fetching[deployment_id] = asyncio.create_task(
+                self.refresh_log(project_name, deployment_id)
             )
+            task.add_done_callback(lambda _: self.fetching.pop(deployment_id, None))
+        # A command that gives up does not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    async def refresh_log(self, project_name: str, deployment_id: str) -> CachedLog:
+        async with self.fetches:
+            with FETCH_SECONDS.time():
+                logs: dict = await self.client.pages.projects.deployments.history.logs.get(
+                    deployment_id,
+                    account_id=getenv("CLOUDFLARE_ACCOUNT_ID"),
+                    project_name=project_name,
+                )  # type: ignore
+
+        # Filtering is CPU bound on long logs, keep it off the event loop, and
+        # only the entries that were added since the last fetch need it
+        entries = logs["data"]
+        while True:
+            start = self.logs.unseen(self.logs.get(deployment_id), entries)
+            lines = await asyncio.to_thread(lambda: list(filter_entries(entries[start:])))
+            log = self.logs.update(deployment_id, entries, start, lines)
+            if log is not None:
+                return log
+
+    @slash_command(name="show-logs", guild_ids=(DEBUG_SERVER_ID,))
+    async def show_logs(
+        self,
+        ctx: ApplicationContext,
+        project_name: str,
+        links: Option(str, "Deployment links or IDs, separated by spaces or commas"), # type:ignore
+        since: Option(str, "Only lines logged since, e.g. 15m, 2h or an ISO timestamp", required=False) = None, # type:ignore
+    ):
+        try:
+            after = parse_since(since) if since else None
+        except ValueError:
+            await ctx.respond(f"Could not read `{since}` as a time.", ephemeral=True)
+            return
+
+        # Long logs take longer than an interaction may go unanswered
+        await ctx.defer()
+        deployment_ids = list(
+            dict.fromkeys(path.basename(link.rstrip("/")) for link in LINK_SEPARATORS.split(links) if link)
         )
+        results = await asyncio.gather(
+            *(self.fetch_log(project_name, deployment_id) for deployment_id in deployment_ids),
+            return_exceptions=True,
+        )
+
+        logs = {}
+        failures = []
+        for deployment_id, result in zip(deployment_ids, results):
+            if isinstance(result, BaseException):
+                failures.append(f"Could not fetch `{deployment_id}`: {result}")
+            else:
+                logs[deployment_id] = result.lines_since(after)
+
+        if not logs:
+            await ctx.respond("\n".join(failures) or "No deployments given.")
+            return
+
+        data, filename = await asyncio.to_thread(build_log_file, merge_logs(logs))
 
-        await ctx.respond(files=[File(data, filename="log.txt")])  # type: ignore
+        await ctx.respond("\n".join(failures) or None, files=[File(data, filename=filename)])  # type: ignore
 
 
 def setup(bot):
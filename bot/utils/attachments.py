@@ -0,0 +1,139 @@
+import asyncio
+
+from base64 import b64encode
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from discord import Attachment, HTTPException
+from hashlib import sha256
+from io import BytesIO
+from PIL import Image
+from typing import List
+
+ALLOWED_MIME_TYPES = ["image/png", "image/jpeg", "image/gif"]
+
+
+class UnsupportedAttachment(Exception):
+    def __init__(self, filename: str, reason: str):
+        super().__init__(f"{filename}: {reason}")
+        self.filename = filename
+        self.reason = reason
+
+
+def digest_of(data: bytes) -> str:
+    return sha256(data).hexdigest()
+
+
+def downscale(data: bytes, max_side: int, quality: int) -> bytes:
+    """
+    Shrinks an image to fit in a `max_side` square and re-encodes it as a JPEG.
+
+    Only the first frame of an animation is kept and transparency is flattened
+    onto white.
+
+    :raises Image.DecompressionBombError: if the image has more pixels than PIL
+    allows, whatever the size of the file
+    """
+    with Image.open(BytesIO(data)) as image:
+        # Only the header has been read so far, decoding allocates every pixel
+        width, height = image.size
+        if width * height > Image.MAX_IMAGE_PIXELS:  # type: ignore
+            raise Image.DecompressionBombError(f"{width}x{height} is too many pixels")
+        image.seek(0)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        output = BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class AttachmentPipeline:
+    """
+    Turns image attachments into compact inline images for vision models.
+
+    Attachments are downloaded with at most `concurrency` downloads at a time and
+    are downscaled and re-encoded in a thread pool, off the event loop. Results are
+    cached by the hash of the downloaded content, up to `cache_bytes` in total, so
+    an image that is posted again is not processed again.
+    """
+
+    def __init__(
+        self,
+        max_side: int = 1024,
+        quality: int = 80,
+        concurrency: int = 4,
+        cache_bytes: int = 32 * 1024 * 1024,
+        max_download: int = 20 * 1024 * 1024,
+    ):
+        self.max_side = max_side
+        self.quality = quality
+        self.cache_bytes = cache_bytes
+        self.max_download = max_download
+        self.hits = 0
+        self.misses = 0
+        self._downloads = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="attachments")
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_size = 0
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def check(self, attachment: Attachment):
+        """
+        Raises UnsupportedAttachment if the attachment cannot be sent along.
+        """
+        if attachment.content_type not in ALLOWED_MIME_TYPES:
+            raise UnsupportedAttachment(attachment.filename, "not an accepted file type")
+        if attachment.size > self.max_download:
+            raise UnsupportedAttachment(attachment.filename, "too large")
+
+    async def prepare(self, attachments: List[Attachment]) -> List[str]:
+        """
+        Prepares every attachment at once, as data URLs in the order of the attachments.
+
+        Every attachment is checked before anything is downloaded.
+        """
+        for attachment in attachments:
+            self.check(attachment)
+        return list(await asyncio.gather(*map(self._prepare, attachments)))
+
+    async def _prepare(self, attachment: Attachment) -> str:
+        async with self._downloads:
+            try:
+                data = await attachment.read()
+            except HTTPException as e:
+                raise UnsupportedAttachment(attachment.filename, "no longer available") from e
+
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(self._executor, digest_of, data)
+        url = self._cache.get(digest)
+        if url is not None:
+            self.hits += 1
+            self._cache.move_to_end(digest)
+            return url
+
+        self.misses += 1
+        try:
+            image = await loop.run_in_executor(
+                self._executor, downscale, data, self.max_side, self.quality
+            )
+        except Image.DecompressionBombError as e:
+            raise UnsupportedAttachment(attachment.filename, "too large") from e
+        except (OSError, ValueError) as e:
+            raise UnsupportedAttachment(attachment.filename, "not a readable image") from e
+
+        url = f"data:image/jpeg;base64,{b64encode(image).decode()}"
+        if digest not in self._cache:
+            self._cache_size += len(url)
+        self._cache[digest] = url
+        while self._cache_size > self.cache_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_size -= len(evicted)
+        return url
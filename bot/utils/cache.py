@@ -0,0 +1,64 @@
+import asyncio
+
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class AsyncTTLCache:
+    """
+    Caches the results of coroutines by key.
+
+    Entries expire `ttl` seconds after they were created and the least recently used
+    entry is evicted once there are more than `max_entries`. Concurrent lookups of a
+    key that is still being created wait for that one creation rather than starting
+    their own. Failed creations are not cached.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_create(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            # Shielded so that a cancelled waiter does not cancel everyone else
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Consumed here so an unawaited failure is not reported twice
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            self._entries[key] = (monotonic() + self.ttl, value)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value
+        finally:
+            del self._inflight[key]
@@ -0,0 +1,45 @@
+from discord import Intents, MemberCacheFlags
+from typing import Any, Dict, Iterable
+
+CHUNK_MODES = ("on", "off", "lazy")
+
+
+def client_options(
+    member_cache: Iterable[str], chunk_guilds: Any, message_cache: int
+) -> Dict[str, Any]:
+    """
+    The intents and cache options to create the bot with.
+
+    :param member_cache: the MemberCacheFlags to turn on, e.g. ["interaction"]
+    :param chunk_guilds: "on" to fetch every member of every guild before the bot
+    is ready, "off" to never, "lazy" to fetch a guild's members once it is used
+    :param message_cache: how many messages to keep, 0 keeps none
+    :raises ValueError: if an option is not one of the above
+    """
+    # YAML reads a bare on and off as booleans
+    chunk_guilds = {True: "on", False: "off"}.get(chunk_guilds, chunk_guilds)
+    if chunk_guilds not in CHUNK_MODES:
+        raise ValueError(f"chunk_guilds must be one of {', '.join(CHUNK_MODES)}, not {chunk_guilds}")
+
+    flags = MemberCacheFlags.none()
+    for flag in member_cache:
+        if flag not in MemberCacheFlags.VALID_FLAGS:
+            raise ValueError(f"{flag} is not a member cache flag")
+        setattr(flags, flag, True)
+    # Chunked members are only kept with the joined flag
+    if chunk_guilds != "off":
+        flags.joined = True
+
+    intents = Intents.default()
+    intents.message_content = True
+    intents.dm_messages = True
+    # Chunking and caching members as they join are all the members intent is for
+    intents.members = flags.joined
+
+    return {
+        "intents": intents,
+        "member_cache_flags": flags,
+        "chunk_guilds_at_startup": chunk_guilds == "on",
+        # 0 would mean the default of 1000 to discord, None turns the cache off
+        "max_messages": message_cache or None,
+    }
@@ -1,11 +1,73 @@
-import aiohttp
+import asyncio
+import random
 
-async def mystBin_upload(output: str, *, content_type: str = "application/json") -> str:
-    data = bytes(output, 'utf-8')
+from aiohttp import ClientConnectionError, ClientResponseError, ClientSession
+from functools import partial
+from typing import IO, AsyncIterator, Iterable, Optional, Union
 
-    async with aiohttp.ClientSession() as cs:
-        async with cs.post('https://mystb.in/documents', data=data) as r:
-            res = await r.json(content_type=content_type)
-            key = res["key"]
+from bot.utils.http import get_session
 
-    return f'https://mystb.in/{key}'
+MYSTBIN_URL = "https://mystb.in"
+CHUNK_SIZE = 64 * 1024
+Uploadable = Union[str, bytes, IO, Iterable[Union[str, bytes]]]
+
+
+async def stream(output: Union[IO, Iterable[Union[str, bytes]]]) -> AsyncIterator[bytes]:
+    """
+    Yields an upload as encoded chunks, file objects are read a block at a time.
+    """
+    if hasattr(output, "read"):
+        output = iter(partial(output.read, CHUNK_SIZE), output.read(0))  # type: ignore
+    for chunk in output:  # type: ignore
+        yield chunk.encode() if isinstance(chunk, str) else chunk
+
+
+async def mystBin_upload(
+    output: Uploadable,
+    *,
+    content_type: str = "application/json",
+    session: Optional[ClientSession] = None,
+    base_url: str = MYSTBIN_URL,
+    retries: int = 3,
+    backoff: float = 0.5,
+) -> str:
+    """
+    Uploads to mystbin and returns the link to the paste.
+
+    Strings and bytes are sent as they are, file objects and other iterables are
+    streamed in chunks without being joined in memory first. Connection errors,
+    timeouts and 429/5xx responses are retried with exponential backoff. A file
+    object is rewound for a retry if it is seekable, any other stream can only be
+    sent once and so is not retried.
+    """
+    session = session or get_session()
+    replayable = isinstance(output, (str, bytes)) or (
+        hasattr(output, "seekable") and output.seekable()  # type: ignore
+    )
+    position = output.tell() if hasattr(output, "tell") and replayable else None  # type: ignore
+
+    attempt = 0
+    while True:
+        if isinstance(output, str):
+            data = output.encode()
+        elif isinstance(output, bytes):
+            data = output
+        else:
+            if position is not None:
+                output.seek(position)  # type: ignore
+            data = stream(output)  # type: ignore
+
+        try:
+            async with session.post(f"{base_url}/documents", data=data) as r:
+                if r.status == 429 or r.status >= 500:
+                    r.raise_for_status()
+                res = await r.json(content_type=content_type)
+                key = res["key"]
+        except (ClientConnectionError, ClientResponseError, asyncio.TimeoutError) as e:
+            transient = not isinstance(e, ClientResponseError) or e.status == 429 or e.status >= 500
+            attempt += 1
+            if not transient or attempt > retries or not replayable:
+                raise
+            await asyncio.sleep(backoff * 2 ** (attempt - 1) * (1 + random.random()))
+        else:
+            return f"{base_url}/{key}"
@@ -0,0 +1,245 @@
+from collections import OrderedDict, deque
+from time import monotonic
+from traceback import print_exc
+from typing import Any, Deque, Dict, List, Optional, Union
+
+Content = Union[str, List[Dict[str, Any]]]
+
+# Every message carries a few tokens of framing and images are billed at a flat
+# rate. Until the tokenizer is loaded, a token is taken to be about four
+# characters of English.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_TOKENS = 765
+TOKENIZER_MODEL = "gpt-4o"
+# What a message record costs in memory beside its content
+MESSAGE_OVERHEAD_BYTES = 200
+
+_encoding = None
+
+
+def load_tokenizer(model: str = TOKENIZER_MODEL) -> bool:
+    """
+    Loads the tokenizer of a model, from then on token counts are exact.
+
+    tiktoken is imported here rather than when the bot starts, and the first load
+    may download the encoding, so call it off the event loop.
+
+    :return: whether the tokenizer could be loaded
+    """
+    global _encoding
+    try:
+        import tiktoken
+
+        _encoding = tiktoken.encoding_for_model(model)
+    except ImportError:
+        return False
+    except Exception:
+        print_exc()
+        return False
+    return True
+
+
+def count_tokens(text: str) -> int:
+    """
+    The number of tokens in a text, counted with the tokenizer if it is loaded.
+    """
+    if _encoding is None:
+        return len(text) // CHARS_PER_TOKEN
+    return len(_encoding.encode_ordinary(text))
+
+
+def estimate_tokens(content: Content) -> int:
+    """
+    The number of tokens a message content will cost, with its framing.
+    """
+    if isinstance(content, str):
+        return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    for part in content:
+        if part.get("type") == "text":
+            tokens += count_tokens(part.get("text", ""))
+        else:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+def estimate_size(content: Content) -> int:
+    """
+    Estimates the number of bytes a message content holds in memory.
+    """
+    if isinstance(content, str):
+        return len(content) + MESSAGE_OVERHEAD_BYTES
+
+    size = MESSAGE_OVERHEAD_BYTES
+    for part in content:
+        if part.get("type") == "text":
+            size += len(part.get("text", "")) + MESSAGE_OVERHEAD_BYTES
+        else:
+            size += len(part.get("image_url", {}).get("url", "")) + MESSAGE_OVERHEAD_BYTES
+    return size
+
+
+class ChatMessage:
+    """
+    A message of a conversation, along with what it costs in tokens and memory.
+
+    Only the role and content are held, the dict the chat API takes is built when
+    a request is, and dropped with it.
+    """
+
+    __slots__ = ("role", "content", "tokens", "size")
+
+    def __init__(self, role: str, content: Content):
+        self.role = role
+        self.content = content
+        self.tokens = estimate_tokens(content)
+        self.size = estimate_size(content)
+
+
+class ConversationBuffer:
+    """
+    The conversation history of a channel.
+
+    A running token total is kept as messages come and go, so trimming the history
+    to a budget costs nothing more than the evictions themselves, each of which is
+    O(1). The system prompt is pinned and is never evicted.
+    """
+
+    def __init__(self, system_message: str):
+        self.system = ChatMessage("system", system_message)
+        self.tokens = 0
+        self.size = 0
+        self.last_active = monotonic()
+        self.cache: Optional["ConversationCache"] = None
+        self._messages: Deque[ChatMessage] = deque()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def append(self, role: str, content: Content):
+        message = ChatMessage(role, content)
+        self._messages.append(message)
+        self._resize(message.tokens, message.size)
+        self.last_active = monotonic()
+
+    def trim(self, budget: int):
+        """
+        Evicts the oldest messages until the history fits in the token budget.
+
+        The latest message is always kept, even if it alone is over budget.
+        """
+        while self.system.tokens + self.tokens > budget and len(self._messages) > 1:
+            message = self._messages.popleft()
+            self._resize(-message.tokens, -message.size)
+
+    def messages(self, budget: int) -> List[Dict[str, Any]]:
+        """
+        The history trimmed to the token budget, in the form the chat API takes it.
+
+        The dicts are built on every call, for the one request that sends them.
+        """
+        self.trim(budget)
+        return [
+            {"role": message.role, "content": message.content}
+            for message in (self.system, *self._messages)
+        ]
+
+    def _resize(self, tokens: int, size: int):
+        self.tokens += tokens
+        self.size += size
+        if self.cache is not None:
+            self.cache.tokens += tokens
+            self.cache.size += size
+
+
+class ConversationCache:
+    """
+    The conversations that are kept in memory, keyed by channel ID.
+
+    The cache holds at most `max_channels` conversations and `max_tokens` tokens or
+    `max_bytes` bytes across all of them, evicting the least recently active channel
+    first. Conversations that have been idle for longer than `idle_ttl` seconds expire.
+    The most recently active conversation is never evicted.
+    """
+
+    def __init__(
+        self, max_channels: int, max_tokens: int, max_bytes: int, idle_ttl: float
+    ):
+        self.max_channels = max_channels
+        self.max_tokens = max_tokens
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.tokens = 0
+        self.size = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._buffers: "OrderedDict[int, ConversationBuffer]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._buffers
+
+    def get(self, channel_id: int) -> Optional[ConversationBuffer]:
+        self.expire()
+        buffer = self._buffers.get(channel_id)
+        if buffer is not None:
+            buffer.last_active = monotonic()
+            self._buffers.move_to_end(channel_id)
+        return buffer
+
+    def put(self, channel_id: int, buffer: ConversationBuffer):
+        self.pop(channel_id)
+        buffer.cache = self
+        buffer.last_active = monotonic()
+        self._buffers[channel_id] = buffer
+        self.tokens += buffer.tokens
+        self.size += buffer.size
+        self.enforce()
+
+    def pop(self, channel_id: int) -> Optional[ConversationBuffer]:
+        buffer = self._buffers.pop(channel_id, None)
+        if buffer is not None:
+            buffer.cache = None
+            self.tokens -= buffer.tokens
+            self.size -= buffer.size
+        return buffer
+
+    def expire(self):
+        """
+        Drops the conversations that have been idle for too long.
+        """
+        deadline = monotonic() - self.idle_ttl
+        # Conversations are ordered by activity, so only the front needs checking
+        while self._buffers:
+            channel_id, buffer = next(iter(self._buffers.items()))
+            if buffer.last_active > deadline:
+                break
+            self.pop(channel_id)
+            self.expirations += 1
+
+    def enforce(self):
+        """
+        Evicts the least recently active conversations until the cache is within budget.
+        """
+        self.expire()
+        while len(self._buffers) > 1 and (
+            len(self._buffers) > self.max_channels
+            or self.tokens > self.max_tokens
+            or self.size > self.max_bytes
+        ):
+            self.pop(next(iter(self._buffers)))
+            self.evictions += 1
+
+    def usage(self) -> Dict[str, int]:
+        return {
+            "channels": len(self._buffers),
+            "messages": sum(len(buffer) for buffer in self._buffers.values()),
+            "tokens": self.tokens,
+            "bytes": self.size,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,64 @@
+import asyncio
+
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class Burst:
+    __slots__ = ("group", "items", "timer")
+
+    def __init__(self, group: Hashable):
+        self.group = group
+        self.items: List[Any] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class Debouncer:
+    """
+    Collects items into bursts, one per key.
+
+    A burst is handed to `flush` once `window` seconds pass without another item of
+    the same group, e.g. the same author, arriving under its key. An item of another
+    group flushes the burst straight away and starts a new one. A window of 0
+    flushes every item on its own.
+    """
+
+    def __init__(self, window: float, flush: Callable[[Hashable, List[Any]], None]):
+        self.window = window
+        self.flush = flush
+        self._bursts: Dict[Hashable, Burst] = {}
+
+    def add(self, key: Hashable, group: Hashable, item: Any) -> bool:
+        """
+        Adds an item to the burst of its key.
+
+        :return: True if the item started a new burst
+        """
+        if self.window <= 0:
+            self.flush(key, [item])
+            return True
+
+        burst = self._bursts.get(key)
+        started = burst is None or burst.group != group
+        if started:
+            if burst is not None:
+                self._flush(key)
+            burst = self._bursts[key] = Burst(group)
+        else:
+            burst.timer.cancel()  # type: ignore
+
+        burst.items.append(item)
+        burst.timer = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        return started
+
+    def close(self):
+        """
+        Drops every burst that has not been flushed yet.
+        """
+        for burst in self._bursts.values():
+            burst.timer.cancel()  # type: ignore
+        self._bursts.clear()
+
+    def _flush(self, key: Hashable):
+        burst = self._bursts.pop(key)
+        burst.timer.cancel()  # type: ignore
+        self.flush(key, burst.items)
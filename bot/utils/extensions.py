@@ -1,34 +1,153 @@
-import importlib
+import ast
+import json
+import os
 
 from os import listdir
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
 
 class Path:
     LAYER1 = 'bot'
     LAYER2 = ['exts', 'assets', 'utils']
     LAYER3 = ['admin']
 
-def get_extensions():
+# What was learned from each extension file, keyed by its modification time
+MANIFEST_PATH = '.extensions.json'
+MANIFEST_VERSION = 1
+
+
+class Extension(NamedTuple):
+    name: str
+    # Whether the module has a setup function, modules without one are not cogs
+    setup: bool
+    # Whether any of its cogs has a command, or anything else decorated but listeners
+    commands: bool
+    # The events its cogs listen to, e.g. on_message
+    listeners: Tuple[str, ...]
+
+    @property
+    def deferrable(self) -> bool:
+        """
+        Whether the extension can wait until one of its listeners is needed.
+
+        Application commands are synced when the bot connects, so an extension
+        with commands has to be loaded up front.
+        """
+        return not self.commands and bool(self.listeners)
+
+
+def decorator_name(decorator: ast.expr) -> str:
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    if isinstance(decorator, ast.Attribute):
+        return decorator.attr
+    if isinstance(decorator, ast.Name):
+        return decorator.id
+    return ''
+
+
+def listener_name(function: ast.AST, decorator: ast.expr) -> str:
+    # @listener("on_x") listens to on_x, a bare @listener() to the function's name
+    if isinstance(decorator, ast.Call) and decorator.args:
+        name = decorator.args[0]
+        if isinstance(name, ast.Constant) and isinstance(name.value, str):
+            return name.value
+    return function.name  # type: ignore
+
+
+def scan(name: str, source: str) -> Extension:
+    """
+    Reads what an extension provides from its source, without importing it.
+    """
+    tree = ast.parse(source)
+    setup = any(
+        isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == 'setup'
+        for node in tree.body
+    )
+
+    commands = False
+    listeners = []
+    for cls in tree.body:
+        if not isinstance(cls, ast.ClassDef):
+            continue
+        for function in cls.body:
+            if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for decorator in function.decorator_list:
+                if decorator_name(decorator) == 'listener':
+                    listeners.append(listener_name(function, decorator))
+                else:
+                    commands = True
+    return Extension(name, setup, commands, tuple(dict.fromkeys(listeners)))
+
+
+def load_manifest(path: str) -> Dict[str, dict]:
+    try:
+        with open(path) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest['files']
+
+
+def save_manifest(path: str, files: Dict[str, dict]):
+    try:
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump({'version': MANIFEST_VERSION, 'files': files}, file)
+        os.replace(f'{path}.tmp', path)
+    except OSError:
+        # A read only checkout scans every time, which is still cheap
+        pass
+
+
+def discover(manifest_path: Optional[str] = MANIFEST_PATH) -> Dict[str, Extension]:
+    """
+    Finds every extension under bot/exts without importing any of them.
+
+    Files are parsed for a setup function, commands and listeners, and the results
+    are kept in a manifest so that only files modified since are parsed again.
+    """
+    cached = load_manifest(manifest_path) if manifest_path else {}
+    files = {}
+    extensions = {}
+    base = f'./{Path.LAYER1}/{Path.LAYER2[0]}/'
+    for subdirectory in sorted(listdir(base)):
+        if not os.path.isdir(base + subdirectory):
+            continue
+        for file in sorted(listdir(base + subdirectory)):
+            if file.startswith("_") or not file.endswith(".py"):
+                continue
+            filename = f'{base}{subdirectory}/{file}'
+            name = f'{Path.LAYER1}.{Path.LAYER2[0]}.{subdirectory}.{file[:-3]}'
+            mtime = os.stat(filename).st_mtime_ns
+
+            entry = cached.get(filename)
+            if entry is None or entry['mtime'] != mtime:
+                with open(filename, encoding='utf-8') as source:
+                    extension = scan(name, source.read())
+                entry = {'mtime': mtime, **extension._asdict()}
+            files[filename] = entry
+
+            extension = Extension(
+                name, entry['setup'], entry['commands'], tuple(entry['listeners'])
+            )
+            # Target module doesn't have a setup function--is not a cog
+            if extension.setup:
+                extensions[name] = extension
+
+    if manifest_path and files != cached:
+        save_manifest(manifest_path, files)
+    return extensions
+
+
+def get_extensions() -> Iterator[str]:
     """
     Loops through directories and subdirectories to find for cogs that can be
     load into
     """
-    base = f'./{Path.LAYER1}/{Path.LAYER2[0]}/'
-    path = ''
-    for subdirectory in listdir(base):
-        path += f'{Path.LAYER1}.{Path.LAYER2[0]}.{subdirectory}.'
+    yield from MANIFEST
 
-        for file in listdir(base+subdirectory):
-            if file.startswith("_"):
-                continue
-            if file.endswith("py"):
-                if not file.startswith("IO"):
-                    mod = importlib.import_module(path+file[:-3])
-                    # Target module doesn't have a setup function--is not a cog
-                    if getattr(mod, "setup", None) is None:
-                        continue
-                path += str(file)[:-3]
-                yield path
-            path = '.'.join(path.split('.')[:-1]) + '.'
-        path = ''
-
-EXTENSIONS = frozenset(get_extensions())
\ No newline at end of file
+
+MANIFEST = discover()
+EXTENSIONS = frozenset(get_extensions())
@@ -0,0 +1,38 @@
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from typing import Optional
+
+from bot.constants import (
+    HTTP_LIMIT,
+    HTTP_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_TIMEOUT,
+)
+
+_session: Optional[ClientSession] = None
+
+
+def get_session() -> ClientSession:
+    """
+    The HTTP session that is shared bot-wide, so connections are pooled and reused.
+
+    The bot opens it on startup and closes it on shutdown, it is created on first use
+    if anything needs it sooner or outside of the bot.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = ClientSession(
+            connector=TCPConnector(
+                limit=HTTP_LIMIT,
+                limit_per_host=HTTP_LIMIT_PER_HOST,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            ),
+            timeout=ClientTimeout(total=HTTP_TIMEOUT),
+        )
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
@@ -0,0 +1,111 @@
+import re
+
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+# Asking outright for a picture, e.g. "draw me a picture of a cat" or "generate an
+# image of a cat". The verb alone is not enough, "draw conclusions" is not a picture.
+IMAGE_REQUEST = re.compile(
+    r"\b(?:draw|paint|sketch|illustrate|doodle|generate|create|make|render|design|"
+    r"produce|give me|show me)\s+"
+    r"(?:\w+\s+){0,3}?(?:image|picture|pic|photo|drawing|painting|illustration|"
+    r"portrait|wallpaper|artwork|logo|sticker)s?\b"
+)
+# Prompts about code, data or wording that may mention images without wanting one,
+# e.g. "render the image as base64 in code"
+TECHNICAL_CONTEXT = re.compile(
+    r"\b(?:code|script|function|program|class|base64|html|css|svg|ascii|python|"
+    r"javascript|api|data|dataset|file|format|convert|resize|compress|crop|plot|"
+    r"chart|graph|matplotlib|latex|regex|meaning|means|mean|conclusions?|"
+    r"analy[sz]e|analysis|explain|summari[sz]e)\b"
+)
+# Words without which a prompt can hardly be asking for an image
+VISUAL_WORDS = re.compile(
+    r"\b(?:image|picture|pic|photo|drawing|draw|paint|painting|sketch|illustrat\w*|"
+    r"portrait|wallpaper|artwork|art|logo|sticker|render|dall-?e|visuali[sz]e)s?\b"
+)
+# Prompts about images rather than asking for one, e.g. "how do I resize an image"
+IMAGE_QUESTION = re.compile(
+    r"^(?:what|why|how|when|where|who|which|is|are|does|do|explain|describe)\b|```"
+)
+WHITESPACE = re.compile(r"\s+")
+
+
+class ImageIntentClassifier:
+    """
+    Decides whether a prompt is a request to generate an image.
+
+    The decision is tiered so that the remote model is only asked when it has to be:
+    a local pattern stage settles the obvious prompts, verdicts are kept in an LRU
+    cache keyed by the normalized prompt and only the ambiguous rest goes to the
+    remote check. `stats` counts how often each tier settled a prompt, and how often
+    the remote check failed. A failed check is treated as no image and is not
+    remembered, so the prompt is asked about again next time.
+    """
+
+    def __init__(
+        self, remote: Callable[[str], Awaitable[Optional[bool]]], cache_size: int = 1024
+    ):
+        """
+        :param remote: the fallback check for prompts that are ambiguous locally,
+        returns None if it could not decide
+        :param cache_size: the number of normalized prompts to remember
+        """
+        self.remote = remote
+        self.cache_size = cache_size
+        self.stats: Counter = Counter()
+        self._cache: "OrderedDict[str, bool]" = OrderedDict()
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        return WHITESPACE.sub(" ", prompt.lower()).strip(" .!?")
+
+    @staticmethod
+    def local(prompt: str) -> Optional[bool]:
+        """
+        Classifies a normalized prompt by its wording alone, None if it is ambiguous.
+        """
+        if not VISUAL_WORDS.search(prompt):
+            return False
+        if IMAGE_QUESTION.search(prompt) or TECHNICAL_CONTEXT.search(prompt):
+            return None
+        if IMAGE_REQUEST.search(prompt):
+            return True
+        return None
+
+    async def classify(self, prompt: str) -> bool:
+        prompt = self.normalize(prompt)
+        if not prompt:
+            self.stats["local"] += 1
+            return False
+
+        verdict = self.local(prompt)
+        if verdict is not None:
+            self.stats["local"] += 1
+            return verdict
+
+        verdict = self._cache.get(prompt)
+        if verdict is not None:
+            self.stats["cache"] += 1
+            self._cache.move_to_end(prompt)
+            return verdict
+
+        verdict = await self.remote(prompt)
+        if verdict is None:
+            self.stats["failed"] += 1
+            return False
+
+        self.stats["remote"] += 1
+        self._cache[prompt] = verdict
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return verdict
+
+    def hit_rates(self) -> Dict[str, float]:
+        """
+        The share of prompts that each tier settled, and that the remote check failed on.
+        """
+        total = sum(self.stats.values()) or 1
+        return {
+            tier: self.stats[tier] / total for tier in ("local", "cache", "remote", "failed")
+        }
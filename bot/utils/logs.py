@@ -0,0 +1,260 @@
+import gzip
+import heapq
+import re
+import shutil
+import string
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from tempfile import TemporaryFile
+from time import monotonic
+from typing import IO, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+# Lines of a deployment log that are worth showing
+MARKERS = re.compile("WARN|▲|⚡")
+# Colour codes and other terminal escape sequences
+ESCAPE_SEQUENCES = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|[@-Z\\-_])")
+# ASCII control characters that string.printable leaves out
+CONTROL_CHARACTERS = str.maketrans(
+    "", "", "".join(chr(c) for c in (*range(32), 127) if chr(c) not in string.printable)
+)
+NON_PRINTABLE = re.compile(f"[^{re.escape(string.printable)}▲⚡️]+")
+
+# Past this many bytes the log is sent gzip compressed
+GZIP_THRESHOLD = 4 * 1024 * 1024
+RELATIVE_TIME = re.compile(r"^(\d+)\s*([smhd])$")
+TIME_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+
+def remove_ascii_codes(text: str) -> str:
+    """
+    Removes ASCII codes from text while preserving readable characters.
+
+    Args:
+        text (str): Input text containing ASCII codes
+
+    Returns:
+        str: Cleaned text with ASCII codes removed
+    """
+    text = ESCAPE_SEQUENCES.sub("", text).translate(CONTROL_CHARACTERS)
+    if text.isascii():
+        return text
+    return NON_PRINTABLE.sub("", text)
+
+
+def parse_timestamp(ts: str) -> float:
+    """
+    Parses an ISO 8601 log timestamp into seconds since the epoch.
+    """
+    ts = ts.replace("Z", "+00:00")
+    # fromisoformat takes at most microseconds
+    ts = re.sub(r"(\.\d{6})\d+", r"\1", ts)
+    moment = datetime.fromisoformat(ts)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def parse_since(since: str) -> float:
+    """
+    Parses a relative time such as "15m" or "2h", or an ISO 8601 timestamp, into
+    seconds since the epoch.
+
+    :raises ValueError: if it is neither
+    """
+    match = RELATIVE_TIME.match(since.strip().lower())
+    if match is None:
+        return parse_timestamp(since.strip())
+    amount, unit = match.groups()
+    return (datetime.now(timezone.utc) - timedelta(**{TIME_UNITS[unit]: int(amount)})).timestamp()
+
+
+def filter_entries(entries: Iterable[Mapping[str, str]]) -> Iterator[str]:
+    """
+    The interesting lines of log entries, cleaned up and prefixed with their timestamp.
+    """
+    for entry in entries:
+        if MARKERS.search(entry["line"]) is not None:
+            yield f"{entry['ts']}\t{remove_ascii_codes(entry['line'])}"
+
+
+def label_lines(label: str, lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        ts, _, text = line.partition("\t")
+        yield f"{ts}\t[{label}]\t{text}"
+
+
+def short_ids(ids: Iterable[str], length: int = 8) -> Dict[str, str]:
+    """
+    The shortest prefix of each ID, at least `length` long, that no other ID starts with.
+    """
+    ids = list(ids)
+    shortened = {}
+    for log_id in ids:
+        size = length
+        while size < len(log_id) and any(
+            other != log_id and other.startswith(log_id[:size]) for other in ids
+        ):
+            size += 1
+        shortened[log_id] = log_id[:size]
+    return shortened
+
+
+def merge_logs(logs: Mapping[str, Iterable[str]]) -> Iterator[str]:
+    """
+    Merges the lines of several logs into one, in the order they were logged, with
+    each line labelled with the log it came from, shortened by short_ids.
+
+    Every log has to be in order already. Lines are merged as they are consumed, so
+    nothing is held but the next line of each log.
+    """
+    if len(logs) == 1:
+        return iter(next(iter(logs.values())))
+    labels = short_ids(logs)
+    return heapq.merge(
+        *(label_lines(labels[log_id], lines) for log_id, lines in logs.items()),
+        key=lambda line: parse_timestamp(line.partition("\t")[0]),
+    )
+
+
+def write_logs(lines: Iterable[str], output: IO[bytes]) -> int:
+    """
+    Writes lines to output, one at a time.
+
+    :return: the number of lines written
+    """
+    written = 0
+    for line in lines:
+        output.write(f"{line}\n".encode())
+        written += 1
+    return written
+
+
+def build_log_file(lines: Iterable[str]) -> Tuple[IO[bytes], str]:
+    """
+    Writes log lines to a temporary file, compressing it if it turned out large.
+
+    Lines go to disk as they are written so that nothing but the lines themselves
+    is held in memory. This is blocking, run it in a thread.
+
+    :return: the file, rewound, and the name to upload it as
+    """
+    output = TemporaryFile()
+    write_logs(lines, output)
+    if output.tell() <= GZIP_THRESHOLD:
+        output.seek(0)
+        return output, "log.txt"
+
+    compressed = TemporaryFile()
+    output.seek(0)
+    with gzip.GzipFile(fileobj=compressed, mode="wb", filename="log.txt") as archive:
+        shutil.copyfileobj(output, archive)
+    output.close()
+    compressed.seek(0)
+    return compressed, "log.txt.gz"
+
+
+class CachedLog:
+    __slots__ = ("lines", "seen", "last_ts", "fetched", "size")
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.seen = 0  # the number of raw entries that have been filtered
+        self.last_ts = ""  # the timestamp of the last raw entry that was filtered
+        self.fetched = 0.0
+        self.size = 0
+
+    def lines_since(self, since: Optional[float] = None) -> List[str]:
+        """
+        The text of every cached line, or only of those logged at or after `since`.
+        """
+        if since is None:
+            return self.lines
+        # Lines are in the order they were logged, so only a few timestamps need parsing
+        low, high = 0, len(self.lines)
+        while low < high:
+            middle = (low + high) // 2
+            if parse_timestamp(self.lines[middle].partition("\t")[0]) < since:
+                low = middle + 1
+            else:
+                high = middle
+        return self.lines[low:]
+
+
+class DeploymentLogCache:
+    """
+    The filtered lines of deployment logs, keyed by deployment ID.
+
+    Refreshing a cached log only filters the entries that were added since it was
+    last seen, and a log that was fetched less than `refresh_interval` seconds ago
+    is not fetched again at all. Logs are evicted least recently used first once
+    they hold more than `max_bytes` of lines between them.
+    """
+
+    def __init__(self, max_bytes: int, refresh_interval: float):
+        self.max_bytes = max_bytes
+        self.refresh_interval = refresh_interval
+        self.size = 0
+        self._logs: "OrderedDict[str, CachedLog]" = OrderedDict()
+
+    def get(self, deployment_id: str) -> Optional[CachedLog]:
+        """
+        The cached log of a deployment, if any. Only `update` adds logs, so looking
+        up IDs that never fetch does not fill the cache.
+        """
+        log = self._logs.get(deployment_id)
+        if log is not None:
+            self._logs.move_to_end(deployment_id)
+        return log
+
+    def is_fresh(self, log: Optional[CachedLog]) -> bool:
+        return log is not None and monotonic() - log.fetched < self.refresh_interval
+
+    @staticmethod
+    def unseen(log: Optional[CachedLog], entries: Sequence[Mapping[str, str]]) -> int:
+        """
+        Where the entries of a fresh fetch that the cached log has not filtered yet
+        start, 0 if the log was not simply appended to and has to start over.
+        """
+        if log is not None and log.seen and len(entries) >= log.seen and entries[log.seen - 1]["ts"] == log.last_ts:
+            return log.seen
+        return 0
+
+    def update(
+        self,
+        deployment_id: str,
+        entries: Sequence[Mapping[str, str]],
+        start: int,
+        lines: List[str],
+    ) -> Optional[CachedLog]:
+        """
+        Records a fetch of a log along with the lines filtered from its entries from
+        `start` on.
+
+        Filtering happens while other fetches of the same log may finish, so lines
+        that were filtered from a different point than the cached log is now at are
+        dropped rather than added twice.
+
+        :return: the cached log, None if it was evicted while the lines were being
+        filtered from past its start, and they have to be filtered again from 0
+        """
+        log = self.get(deployment_id)
+        if start != self.unseen(log, entries):
+            return log
+        if log is None:
+            log = self._logs[deployment_id] = CachedLog()
+        if start == 0:
+            self.size -= log.size
+            log.lines, log.size = [], 0
+        added = sum(map(len, lines))
+        log.lines.extend(lines)
+        log.size += added
+        self.size += added
+        log.seen = len(entries)
+        log.last_ts = entries[-1]["ts"] if entries else ""
+        log.fetched = monotonic()
+
+        while self.size > self.max_bytes and len(self._logs) > 1:
+            _, evicted = self._logs.popitem(last=False)
+            self.size -= evicted.size
+        return log
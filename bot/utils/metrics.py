@@ -0,0 +1,183 @@
+"""
+Counters and latency histograms, exposed in the Prometheus text format.
+
+Metrics are created through the module level registry and are looked up by name and
+labels, so a cog that is reloaded picks up the same metrics it had before. Recording
+a value is a few attribute updates and a bisect, cheap enough to leave on.
+"""
+from aiohttp import web
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.histogram.observe(perf_counter() - self.start)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        # One count per bucket, the last is for values past every bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> Timer:
+        """
+        A context manager that observes how long its block took.
+        """
+        return Timer(self)
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Family:
+    __slots__ = ("kind", "help", "children")
+
+    def __init__(self, kind: str, help: str):
+        self.kind = kind
+        self.help = help
+        self.children: Dict[Labels, object] = {}
+
+
+def format_labels(labels: Labels, **extra: str) -> str:
+    pairs = (*labels, *extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class Registry:
+    def __init__(self):
+        self._families: Dict[str, Family] = {}
+
+    def _child(self, kind: str, name: str, help: str, labels: Dict[str, str], factory):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = Family(kind, help)
+        elif family.kind != kind:
+            raise TypeError(f"metric {name} is a {family.kind}, not a {kind}")
+
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        child = family.children.get(key)
+        if child is None:
+            child = family.children[key] = factory()
+        return child
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        return self._child("counter", name, help, labels, Counter)  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        **labels: str,
+    ) -> Histogram:
+        return self._child("histogram", name, help, labels, lambda: Histogram(buckets))  # type: ignore
+
+    def children(self, name: str) -> Iterator[Tuple[Dict[str, str], object]]:
+        """
+        Every labelled metric of a family along with its labels.
+        """
+        family = self._families.get(name)
+        if family is not None:
+            for labels, child in family.children.items():
+                yield dict(labels), child
+
+    def render(self) -> str:
+        lines = []
+        for name, family in self._families.items():
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for labels, child in family.children.items():
+                if isinstance(child, Counter):
+                    lines.append(f"{name}{format_labels(labels)} {child.value}")
+                    continue
+
+                cumulative = 0
+                for bound, count in zip((*child.bounds, float("inf")), child.counts):  # type: ignore
+                    cumulative += count
+                    lines.append(
+                        f"{name}_bucket{format_labels(labels, le=format_bound(bound))} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{format_labels(labels)} {child.sum}")  # type: ignore
+                lines.append(f"{name}_count{format_labels(labels)} {child.count}")  # type: ignore
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+
+
+async def start_server(
+    host: str, port: int, registry: Optional[Registry] = None
+) -> web.AppRunner:
+    """
+    Serves the metrics of a registry at /metrics.
+
+    :return: the runner of the server, clean it up to stop serving
+    """
+    registry = registry or REGISTRY
+
+    async def metrics(_: web.Request) -> web.Response:
+        return web.Response(
+            body=registry.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
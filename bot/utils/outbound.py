@@ -0,0 +1,127 @@
+import asyncio
+
+from collections import deque
+from discord import Message
+from discord.abc import Messageable
+from typing import Any, Deque, Dict, List, Optional, Set
+
+
+class Outgoing:
+    __slots__ = ("content", "kwargs", "future", "coalesce")
+
+    def __init__(
+        self,
+        content: Optional[str],
+        kwargs: Dict[str, Any],
+        future: asyncio.Future,
+        coalesce: bool = True,
+    ):
+        self.content = content
+        self.kwargs = kwargs
+        self.future = future
+        # Plain text that may share a message with its neighbours
+        self.coalesce = coalesce and content is not None and not kwargs
+
+
+class OutboundScheduler:
+    """
+    Sends messages on behalf of every cog, one channel at a time.
+
+    Each channel has a queue that is drained by its own sender, which keeps a single
+    request in flight and sends the next one the moment it returns. Pacing is left to
+    the rate-limit buckets of the HTTP client, which hold a request back only when
+    Discord reports the bucket as exhausted, so there is no fixed delay between sends.
+    Plain text that piles up while a channel is busy is coalesced into as few
+    messages as fit within `max_length`. Only sends without any other arguments are
+    coalesced, so a reply never absorbs text that was not meant as one.
+    """
+
+    def __init__(self, max_length: int = 2000):
+        self.max_length = max_length
+        self.coalesced = 0
+        self._queues: Dict[int, Deque[Outgoing]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def send(
+        self,
+        channel: Messageable,
+        content: Optional[str] = None,
+        *,
+        coalesce: bool = True,
+        **kwargs,
+    ) -> "asyncio.Future[Message]":
+        """
+        Queues a message to be sent to the channel.
+
+        Takes the same arguments as `Messageable.send`, e.g. `reference` to reply.
+
+        :param coalesce: False to always send the content as a message of its own,
+        for callers that keep the message to edit it later
+        :return: a future of the message that was sent, coalesced sends share it
+        """
+        loop = asyncio.get_running_loop()
+        outgoing = Outgoing(content, kwargs, loop.create_future(), coalesce)
+        key = channel.id  # type: ignore
+        queue = self._queues.get(key)
+        if queue is None:
+            self._queues[key] = deque((outgoing,))
+            task = loop.create_task(self._sender(channel, key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            queue.append(outgoing)
+        return outgoing.future
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _coalesce(self, queue: Deque[Outgoing]) -> List[Outgoing]:
+        first = queue.popleft()
+        batch = [first]
+        if not first.coalesce:
+            return batch
+
+        length = len(first.content)  # type: ignore
+        while queue:
+            follower = queue[0]
+            if (
+                not follower.coalesce
+                or length + 1 + len(follower.content) > self.max_length  # type: ignore
+            ):
+                break
+            batch.append(queue.popleft())
+            length += 1 + len(follower.content)  # type: ignore
+        return batch
+
+    async def _sender(self, channel: Messageable, key: int):
+        queue = self._queues[key]
+        batch: List[Outgoing] = []
+        try:
+            while queue:
+                batch = self._coalesce(queue)
+                self.coalesced += len(batch) - 1
+                content = batch[0].content
+                if len(batch) > 1:
+                    content = "\n".join(outgoing.content for outgoing in batch)  # type: ignore
+
+                try:
+                    message = await channel.send(content, **batch[0].kwargs)
+                except Exception as e:
+                    for outgoing in batch:
+                        if not outgoing.future.done():
+                            outgoing.future.set_exception(e)
+                else:
+                    for outgoing in batch:
+                        if not outgoing.future.done():
+                            outgoing.future.set_result(message)
+        finally:
+            # Only reached with work left over if the sender was cancelled
+            for outgoing in (*batch, *queue):
+                if not outgoing.future.done():
+                    outgoing.future.cancel()
+            del self._queues[key]
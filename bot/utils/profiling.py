@@ -0,0 +1,97 @@
+"""
+Times every module imported while it is installed, for the startup profiling mode
+of main.py.
+
+Each module is timed as it executes, split into the time of its own body and the
+time of the modules it imported in turn, much like `python -X importtime`.
+"""
+import sys
+
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+
+class TimedLoader:
+    """
+    Stands in for a module's loader while the module executes, and puts the real
+    one back once it has.
+    """
+
+    def __init__(self, loader, profiler: "ImportProfiler"):
+        self.loader = loader
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self.profiler._stack
+        stack.append(0.0)
+        start = perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.profiler.imports[module.__name__] = (elapsed - nested, elapsed)
+            module.__loader__ = self.loader
+            if getattr(module, "__spec__", None) is not None:
+                module.__spec__.loader = self.loader
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class ImportProfiler:
+    def __init__(self):
+        # Module name to the time of its own body and its time including imports
+        self.imports: Dict[str, Tuple[float, float]] = {}
+        self._stack: List[float] = []
+
+    def install(self):
+        sys.meta_path.insert(0, self)  # type: ignore
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)  # type: ignore
+
+    def find_spec(self, name, path, target=None):
+        # Let the finders after this one find the module, then time its loader
+        for finder in sys.meta_path[sys.meta_path.index(self) + 1 :]:  # type: ignore
+            find_spec = getattr(finder, "find_spec", None)
+            if find_spec is None:
+                continue
+            spec = find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = TimedLoader(spec.loader, self)
+        return spec
+
+    def slowest(self, limit: int = 20) -> List[Tuple[str, float, float]]:
+        """
+        The modules that took the longest including their imports, slowest first.
+        """
+        ranked = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)
+        return [(name, own, total) for name, (own, total) in ranked[:limit]]
+
+
+def format_profile(
+    profiler: ImportProfiler, stages: Dict[str, float], limit: int = 20
+) -> str:
+    """
+    A report of the slowest imports followed by the time of each stage of startup.
+    """
+    lines = [f"{'import':<48}{'self ms':>10}{'total ms':>10}"]
+    for name, own, total in profiler.slowest(limit):
+        lines.append(f"{name:<48}{own * 1000:>10.1f}{total * 1000:>10.1f}")
+    lines.append("")
+    lines.append(f"{'stage':<48}{'ms':>20}")
+    for stage, seconds in stages.items():
+        lines.append(f"{stage:<48}{seconds * 1000:>20.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,60 @@
+from time import monotonic
+from typing import Dict, Hashable
+
+
+class TokenBucket:
+    """
+    A bucket of `capacity` tokens that refills at `rate` tokens a second.
+    """
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def available(self) -> float:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def take(self, tokens: float = 1) -> bool:
+        if self.available() < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+class KeyedTokenBuckets:
+    """
+    A token bucket per key, e.g. per user or per channel.
+
+    Buckets are created on first use. Once there are more than `max_keys` of them,
+    the ones that have refilled completely are dropped, since a new bucket would
+    be no different.
+    """
+
+    def __init__(self, capacity: float, rate: float, max_keys: int = 1024):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+
+    def bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune()
+            bucket = self._buckets[key] = TokenBucket(self.capacity, self.rate)
+        return bucket
+
+    def take(self, key: Hashable, tokens: float = 1) -> bool:
+        return self.bucket(key).take(tokens)
+
+    def _prune(self):
+        full = [key for key, bucket in self._buckets.items() if bucket.available() >= bucket.capacity]
+        for key in full:
+            del self._buckets[key]
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import py_compile
+
+from discord.ext import commands
+from time import perf_counter
+from traceback import format_exception_only, print_exc
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+
+class Reload(NamedTuple):
+    extension: str
+    seconds: float
+    # Why the extension failed to reload, None if it did not
+    error: Optional[str]
+
+
+def source_of(extension: str) -> str:
+    return extension.replace(".", "/") + ".py"
+
+
+def describe(error: BaseException) -> str:
+    return "".join(format_exception_only(type(error), error)).strip()
+
+
+def compile_source(extension: str):
+    py_compile.compile(source_of(extension), doraise=True)
+
+
+async def reload_extensions(bot: commands.Bot, extensions: Iterable[str]) -> List[Reload]:
+    """
+    Reloads extensions, loading those that are not loaded.
+
+    Every extension is compiled first, all at once in threads, which catches syntax
+    errors before the loaded version is torn down and leaves only the import itself
+    to the event loop. An extension that fails to compile keeps its loaded version.
+
+    :return: how long each extension took to reload and why it failed, if it did
+    """
+    extensions = list(extensions)
+    compiled = await asyncio.gather(
+        *(asyncio.to_thread(compile_source, ext) for ext in extensions),
+        return_exceptions=True,
+    )
+
+    reloads = []
+    for ext, error in zip(extensions, compiled):
+        start = perf_counter()
+        if isinstance(error, BaseException):
+            reloads.append(Reload(ext, 0.0, describe(error)))
+            continue
+        try:
+            if ext in bot.extensions:
+                bot.reload_extension(ext)
+            else:
+                bot.load_extension(ext)
+        except Exception as e:
+            reloads.append(Reload(ext, perf_counter() - start, describe(e)))
+        else:
+            reloads.append(Reload(ext, perf_counter() - start, None))
+    return reloads
+
+
+class ExtensionWatcher:
+    """
+    Polls the source files of extensions and hands the ones that changed to
+    `on_change`, every `interval` seconds.
+
+    Polling a handful of files is a few stat calls, cheap enough to not need inotify.
+    """
+
+    def __init__(
+        self,
+        extensions: Iterable[str],
+        interval: float,
+        on_change: Callable[[List[str]], Awaitable[None]],
+    ):
+        self.interval = interval
+        self.on_change = on_change
+        self._mtimes: Dict[str, int] = {ext: self.mtime_of(ext) for ext in extensions}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def mtime_of(extension: str) -> int:
+        try:
+            return os.stat(source_of(extension)).st_mtime_ns
+        except OSError:
+            return 0
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        loop = loop or asyncio.get_running_loop()
+        if self._task is None:
+            self._task = loop.create_task(self._watch())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def poll(self) -> List[str]:
+        """
+        The extensions whose source changed since the last poll.
+        """
+        changed = []
+        for ext, mtime in self._mtimes.items():
+            current = self.mtime_of(ext)
+            if current != mtime:
+                self._mtimes[ext] = current
+                changed.append(ext)
+        return changed
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            changed = self.poll()
+            if not changed:
+                continue
+            try:
+                await self.on_change(changed)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                print_exc()
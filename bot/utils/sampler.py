@@ -0,0 +1,113 @@
+import asyncio
+
+from collections import deque
+from time import monotonic
+from traceback import print_exc
+from typing import Deque, List, NamedTuple, Optional, Tuple
+
+
+class Sample(NamedTuple):
+    time: float
+    cpu: float  # percent of the host's CPU, over the interval before the sample
+    memory: float  # percent of the host's memory in use
+    rss: int  # resident bytes of the bot
+    sockets: int  # open internet sockets of the bot
+    tasks: int  # tasks alive on the event loop
+    lag: float  # seconds the sampler's sleep overran by, how late the loop was
+
+
+class SystemSampler:
+    """
+    Samples the host and the bot every `interval` seconds and keeps the last
+    `history` seconds of samples in a ring buffer.
+
+    The psutil calls run in a thread, so a sample costs the event loop no more
+    than counting its tasks. psutil is imported there too, once, rather than when
+    the bot starts.
+    """
+
+    def __init__(self, interval: float = 5.0, history: float = 900.0):
+        self.interval = interval
+        self.samples: Deque[Sample] = deque(maxlen=max(1, int(history / interval)))
+        self._process = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        loop = loop or asyncio.get_running_loop()
+        if self._task is None:
+            self._task = loop.create_task(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _prime(self):
+        import psutil
+
+        self._process = psutil.Process()
+        # CPU percentages are measured between calls, the first one has nothing
+        # to compare against
+        psutil.cpu_percent(None)
+
+    def _measure(self) -> Tuple[float, float, int, int]:
+        import psutil
+
+        process = self._process
+        # Renamed in psutil 6
+        connections = getattr(process, "net_connections", None) or process.connections  # type: ignore
+        return (
+            psutil.cpu_percent(None),
+            psutil.virtual_memory().percent,
+            process.memory_info().rss,  # type: ignore
+            len(connections(kind="inet")),
+        )
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.to_thread(self._prime)
+        except Exception:
+            print_exc()
+            return
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            try:
+                cpu, memory, rss, sockets = await asyncio.to_thread(self._measure)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                print_exc()
+                continue
+            tasks = len(asyncio.all_tasks(loop))
+            self.samples.append(Sample(monotonic(), cpu, memory, rss, sockets, tasks, lag))
+
+    @property
+    def latest(self) -> Optional[Sample]:
+        return self.samples[-1] if self.samples else None
+
+    def window(self, seconds: float) -> List[Sample]:
+        """
+        The samples of the last `seconds` seconds, oldest first.
+        """
+        cutoff = monotonic() - seconds
+        recent = []
+        for sample in reversed(self.samples):
+            if sample.time < cutoff:
+                break
+            recent.append(sample)
+        recent.reverse()
+        return recent
+
+    def summary(self, field: str, seconds: float) -> Optional[Tuple[float, float, float]]:
+        """
+        The min, average and 95th percentile of a field over the last `seconds` seconds.
+        """
+        values = sorted(getattr(sample, field) for sample in self.window(seconds))
+        if not values:
+            return None
+        p95 = values[min(len(values) - 1, int(0.95 * len(values)))]
+        return values[0], sum(values) / len(values), p95
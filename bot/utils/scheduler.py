@@ -0,0 +1,100 @@
+import asyncio
+
+from collections import deque
+from time import monotonic
+from traceback import print_exc
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+Job = Callable[[], Awaitable[None]]
+
+
+class ChannelScheduler:
+    """
+    Runs jobs on a fixed pool of workers.
+
+    Jobs that share a key (usually a channel ID) run one at a time and in the
+    order they were submitted, while jobs with different keys run concurrently.
+    Keys take turns in a round robin, so a busy channel only ever holds one
+    worker at a time and cannot starve the rest.
+
+    At most `max_pending` jobs are admitted at once and a job that waited longer
+    than `max_wait` seconds for a worker is shed instead of run, in which case its
+    shed job runs in its place. Either limit is off when it is 0.
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 0, max_wait: float = 0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.depth = 0
+        self.rejected = 0
+        self.shed = 0
+        self._pending: Dict[Hashable, Deque[Tuple[Job, Optional[Job], float]]] = {}
+        self._ready: "asyncio.Queue[Hashable]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Spawns the workers on the given loop, or the running loop.
+        """
+        loop = loop or asyncio.get_running_loop()
+        for _ in range(self.workers - len(self._tasks)):
+            self._tasks.append(loop.create_task(self._worker()))
+
+    def close(self):
+        """
+        Cancels the workers, pending jobs are dropped.
+        """
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        self._pending.clear()
+        self.depth = 0
+
+    def submit(self, key: Hashable, job: Job, shed: Optional[Job] = None) -> bool:
+        """
+        Schedules a job behind every other job that was submitted with the same key.
+
+        :param key: the ordering key, jobs of the same key never overlap
+        :param job: a callable that returns the awaitable to be run
+        :param shed: a callable that is run instead of the job if it waited too long
+        :return: False if the job was rejected because too many are pending
+        """
+        if self.max_pending and self.depth >= self.max_pending:
+            self.rejected += 1
+            return False
+
+        self.depth += 1
+        entry = (job, shed, monotonic())
+        jobs = self._pending.get(key)
+        if jobs is None:
+            # A key is only ever in the ready queue once, or held by a worker
+            self._pending[key] = deque((entry,))
+            self._ready.put_nowait(key)
+        else:
+            jobs.append(entry)
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            jobs = self._pending[key]
+            job, shed, submitted = jobs[0]
+            if self.max_wait and monotonic() - submitted > self.max_wait:
+                self.shed += 1
+                job = shed
+            try:
+                if job is not None:
+                    await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                print_exc()
+            finally:
+                jobs.popleft()
+                self.depth -= 1
+                if jobs:
+                    # Go to the back of the line so other keys get a turn
+                    self._ready.put_nowait(key)
+                else:
+                    self._pending.pop(key, None)
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import sqlite3
+import threading
+
+from time import time
+from traceback import print_exc
+from typing import Any, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel_id, id);
+"""
+
+
+class ConversationStore:
+    """
+    Conversation histories persisted to an SQLite database in WAL mode.
+
+    Writes are write-behind: `append` only queues the row and a background task
+    flushes the queue in batches, so the message path never waits on the disk.
+    Reads and flushes run in a worker thread and never overlap. Closing is
+    synchronous, so whatever is still queued is on disk once `close` returns.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        """
+        :param path: the database file, created if it does not exist
+        :param flush_interval: seconds between two flushes of the write queue
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[int, str, str, float]] = []
+        self._lock = asyncio.Lock()
+        # A worker thread can still be writing after the task that awaited it was cancelled
+        self._db_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Spawns the background flusher on the given loop, or the running loop.
+        """
+        loop = loop or asyncio.get_running_loop()
+        self._task = loop.create_task(self._flusher())
+
+    def close(self):
+        """
+        Stops the flusher, writes out whatever is still queued and closes the database.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            self.flush_sync()
+        except sqlite3.Error:
+            print_exc()
+        with self._db_lock:
+            self._db.close()
+
+    def append(self, channel_id: int, role: str, content: Any):
+        """
+        Queues a message to be written with the next batch.
+        """
+        self._pending.append((channel_id, role, json.dumps(content), time()))
+
+    async def flush(self):
+        """
+        Writes every queued message in one transaction.
+        """
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except sqlite3.Error:
+                # Keep the batch for the next flush rather than losing it
+                self._pending[:0] = batch
+                raise
+
+    def flush_sync(self):
+        """
+        Writes every queued message from the calling thread, after any write that
+        a worker thread is still in the middle of.
+        """
+        batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    async def load(self, channel_id: int, limit: int) -> List[Tuple[str, Any]]:
+        """
+        The latest messages of a channel as (role, content) pairs, oldest first.
+        """
+        await self.flush()
+        async with self._lock:
+            rows = await asyncio.to_thread(self._read, channel_id, limit)
+        return [(role, json.loads(content)) for role, content in reversed(rows)]
+
+    async def clear(self, channel_id: int) -> int:
+        """
+        Deletes the history of a channel, returns the number of messages deleted.
+        """
+        async with self._lock:
+            pending = len(self._pending)
+            self._pending = [row for row in self._pending if row[0] != channel_id]
+            deleted = await asyncio.to_thread(self._delete, channel_id)
+        return deleted + pending - len(self._pending)
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except sqlite3.Error:
+                print_exc()
+
+    def _write(self, batch: List[Tuple[int, str, str, float]]):
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT INTO messages (channel_id, role, content, created) VALUES (?, ?, ?, ?)",
+                batch,
+            )
+
+    def _read(self, channel_id: int, limit: int) -> List[Tuple[str, str]]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT role, content FROM messages WHERE channel_id = ? ORDER BY id DESC LIMIT ?",
+                (channel_id, limit),
+            ).fetchall()
+
+    def _delete(self, channel_id: int) -> int:
+        with self._db_lock, self._db:
+            return self._db.execute(
+                "DELETE FROM messages WHERE channel_id = ?", (channel_id,)
+            ).rowcount
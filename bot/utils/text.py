@@ -0,0 +1,75 @@
+import re
+
+from typing import List, Optional, Tuple
+
+# A code fence, with the language it was opened with
+FENCE = re.compile(r"^```(\S*)", re.MULTILINE)
+CLOSE_FENCE = "\n```"
+# Boundaries to split on, the most preferable first
+BREAKS = ("\n\n", "\n", " ")
+
+
+def find_break(text: str, start: int, end: int) -> Tuple[int, int]:
+    """
+    Finds where to end a chunk of text that starts at `start` and may not go past `end`.
+
+    Paragraphs are preferred over lines and lines over words, but only in the second
+    half of the window so that every chunk is at least half full. Without a boundary
+    the text is cut hard at `end`.
+
+    :return: the index of the cut and the length of the boundary that is dropped there
+    """
+    floor = start + (end - start) // 2
+    for boundary in BREAKS:
+        index = text.rfind(boundary, floor, end)
+        if index != -1:
+            return index, len(boundary)
+    return end, 0
+
+
+def open_fence(text: str, start: int, end: int, language: Optional[str] = None) -> Optional[str]:
+    """
+    The language of the code fence that is open at `end`, None if none is.
+
+    :param language: the language of the fence that was open at `start`, if any.
+    A fence opened without a language gives an empty string.
+    """
+    for match in FENCE.finditer(text, start, end):
+        language = match.group(1) if language is None else None
+    return language
+
+
+def split_long_message(message: str, max_length: int = 1900) -> List[str]:
+    """
+    Splits a message into chunks of at most `max_length` characters.
+
+    Runs in linear time over the message. Chunks end on paragraph, line or word
+    boundaries where possible and unbreakable runs are cut hard. A code fence that
+    is open where a chunk ends is closed in that chunk and reopened, with its
+    language, in the next.
+    """
+    fences = [(match.start(), match.group(1)) for match in FENCE.finditer(message)]
+    next_fence = 0
+    language = None  # the language of the fence open at the start of a chunk
+    chunks = []
+    start = 0
+
+    while start < len(message):
+        prefix = "" if language is None else f"```{language}\n"
+        end = max(start + max_length - len(prefix) - len(CLOSE_FENCE), start + 1)
+        if end >= len(message):
+            cut, skip = len(message), 0
+        else:
+            cut, skip = find_break(message, start, end)
+
+        # Follow the fences in the chunk to see whether one is left open
+        while next_fence < len(fences) and fences[next_fence][0] < cut:
+            language = fences[next_fence][1] if language is None else None
+            next_fence += 1
+
+        body = message[start:cut].rstrip()
+        if body.strip():
+            chunks.append(prefix + body + ("" if language is None else CLOSE_FENCE))
+        start = cut + skip
+
+    return chunks
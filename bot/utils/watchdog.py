@@ -0,0 +1,144 @@
+import asyncio
+import os
+import sys
+import threading
+import traceback
+
+from time import perf_counter
+from typing import Dict, List, Optional
+
+from bot.utils.metrics import histogram
+
+LAG_SECONDS = histogram(
+    "bot_loop_lag_seconds",
+    "Seconds the event loop ran the watchdog's heartbeat late by.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+# Frames under here are the bot's own, the first of them is what gets blamed
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Stall:
+    __slots__ = ("culprit", "count", "worst", "total", "stack")
+
+    def __init__(self, culprit: str, stack: List[str]):
+        self.culprit = culprit
+        self.count = 0
+        self.worst = 0.0
+        self.total = 0.0
+        self.stack = stack
+
+    def record(self, seconds: float, stack: List[str]):
+        self.count += 1
+        self.total += seconds
+        if seconds >= self.worst:
+            self.worst = seconds
+            self.stack = stack
+
+
+def blame(stack: traceback.StackSummary) -> str:
+    """
+    The innermost frame of the bot's own code in a stack, or the innermost frame
+    if none of it is the bot's.
+    """
+    for frame in reversed(stack):
+        if frame.filename.startswith(ROOT) and "site-packages" not in frame.filename:
+            return f"{os.path.relpath(frame.filename, ROOT)}:{frame.lineno} in {frame.name}"
+    frame = stack[-1]
+    return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+
+class LoopWatchdog:
+    """
+    Catches whatever holds the event loop for longer than `threshold` seconds.
+
+    A heartbeat on the loop stamps the time every `interval` seconds and records
+    how late it ran. A thread watches the stamp, and once it is older than the
+    threshold, captures the stack of the loop's thread, which is still in the
+    middle of whatever is blocking it. When the loop gets back to the heartbeat
+    the stall is recorded against the bot's innermost frame in that stack.
+
+    Stalls are grouped by that frame, and only the `max_reports` with the worst
+    stalls are kept. Code that holds the GIL throughout, such as a long regex,
+    can hold up the thread as well, in which case the stack is captured as soon
+    as the thread gets to run again.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05, max_reports: int = 20):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_reports = max_reports
+        self.stalls = 0
+        self.worst = 0.0
+        self._reports: Dict[str, Stall] = {}
+        self._beat = perf_counter()
+        self._captured: Optional[traceback.StackSummary] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Starts watching the given loop, or the running loop. Call it from the
+        thread that runs the loop.
+        """
+        if self._thread is not None:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = perf_counter()
+        self._handle = self._loop.call_later(self.interval, self._heartbeat)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._thread = None
+
+    def _heartbeat(self):
+        now = perf_counter()
+        late = max(0.0, now - self._beat - self.interval)
+        LAG_SECONDS.observe(late)
+        self.worst = max(self.worst, late)
+
+        captured, self._captured = self._captured, None
+        if late >= self.threshold:
+            self.stalls += 1
+            if captured is not None:
+                self._record(blame(captured), late, captured.format())
+
+        self._beat = now
+        self._handle = self._loop.call_later(self.interval, self._heartbeat)  # type: ignore
+
+    def _record(self, culprit: str, seconds: float, stack: List[str]):
+        report = self._reports.get(culprit)
+        if report is None:
+            if len(self._reports) >= self.max_reports:
+                mildest = min(self._reports.values(), key=lambda report: report.worst)
+                if mildest.worst >= seconds:
+                    return
+                del self._reports[mildest.culprit]
+            report = self._reports[culprit] = Stall(culprit, stack)
+        report.record(seconds, stack)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            if self._captured is not None or perf_counter() - beat - self.interval < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)  # type: ignore
+            # The loop may have got to the heartbeat in the meantime
+            if frame is not None and self._beat == beat:
+                self._captured = traceback.extract_stack(frame)
+
+    def report(self) -> List[Stall]:
+        """
+        The recorded stalls, worst first.
+        """
+        return sorted(self._reports.values(), key=lambda report: report.worst, reverse=True)
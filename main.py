@@ -1,23 +1,55 @@
+import sys
+
+from time import perf_counter
+
+STARTED = perf_counter()
+# `python main.py --profile-startup` reports where startup time goes. The profiler
+# has to be installed before anything else is imported.
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+if PROFILE_STARTUP:
+    from bot.utils.profiling import ImportProfiler, format_profile
+
+    PROFILER = ImportProfiler()
+    PROFILER.install()
+
 from discord.ext import commands
-from discord import Intents, Status, Game
+from discord import Status, Game
 from datetime import datetime
+from traceback import print_exc
 
-from bot.utils.extensions import EXTENSIONS
-from bot.constants import DEBUG_SERVER_ID, PREFIX, DISCORD_TOKEN
+from bot.utils.cache_policy import client_options
+from bot.utils.extensions import EXTENSIONS, MANIFEST
+from bot.utils.http import close_session, get_session
+from bot.utils.metrics import start_server
+from bot.utils.outbound import OutboundScheduler
+from bot.utils.sampler import SystemSampler
+from bot.utils.watchdog import LoopWatchdog
+from bot.constants import (
+    CACHE_CHUNK_GUILDS,
+    CACHE_MEMBERS,
+    CACHE_MESSAGES,
+    DEBUG_SERVER_ID,
+    PREFIX,
+    DISCORD_TOKEN,
+    LAZY_EXTENSIONS,
+    METRICS_ENABLED,
+    METRICS_HOST,
+    METRICS_PORT,
+    SAMPLER_HISTORY,
+    SAMPLER_INTERVAL,
+    WATCHDOG_ENABLED,
+    WATCHDOG_MAX_REPORTS,
+    WATCHDOG_THRESHOLD,
+)
 
 
 class Bot(commands.Bot):
     EXTENSIONS = EXTENSIONS  # type: ignore
 
     def __init__(self):
-        intents = Intents.default()
-        intents.message_content = True
-        intents.dm_messages = True
-        intents.members = True
-
         super().__init__(
             command_prefix=PREFIX,
-            intents=intents,
+            **client_options(CACHE_MEMBERS, CACHE_CHUNK_GUILDS, CACHE_MESSAGES),
             case_insensitive=True,
             status=Status.dnd,
             activity=Game(name="with your mind"),
@@ -25,14 +57,89 @@ class Bot(commands.Bot):
         )
 
         self.active_since = datetime.now()
+        # Cogs send messages through here rather than pacing the sends themselves
+        self.outbound = OutboundScheduler()
+        self.metrics_server = None
+        self.sampler = SystemSampler(SAMPLER_INTERVAL, SAMPLER_HISTORY)
+        self.watchdog = LoopWatchdog(
+            WATCHDOG_THRESHOLD, interval=WATCHDOG_THRESHOLD / 5, max_reports=WATCHDOG_MAX_REPORTS
+        )
+        # Extensions waiting for one of their events, by event
+        self.deferred_extensions = {}
+        # How long each extension took to load, including its imports
+        self.load_times = {}
+        # Guilds whose members were asked for, when chunking lazily
+        self.chunk_requested = set()
+        if CACHE_CHUNK_GUILDS == "lazy":
+            self.before_invoke(self.chunk_guild)
 
         for ext in EXTENSIONS:
-            self.load_extension(ext)
+            if LAZY_EXTENSIONS and MANIFEST[ext].deferrable:
+                for event in MANIFEST[ext].listeners:
+                    self.deferred_extensions.setdefault(event, set()).add(ext)
+            else:
+                self.timed_load(ext)
+
+    def timed_load(self, ext):
+        start = perf_counter()
+        self.load_extension(ext)
+        self.load_times[ext] = perf_counter() - start
+
+    def dispatch(self, event_name, *args, **kwargs):
+        # Load whatever was waiting on this event before dispatching it, so its
+        # listeners see the event that woke them
+        for ext in self.deferred_extensions.pop(f"on_{event_name}", ()):
+            for waiting in self.deferred_extensions.values():
+                waiting.discard(ext)
+            if ext not in self.extensions:
+                # Raised here it would stop the gateway, and the bot with it
+                try:
+                    self.timed_load(ext)
+                except Exception:
+                    print_exc()
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def chunk_guild(self, ctx):
+        # Fetched in the background, an interaction cannot wait on a large guild
+        guild = ctx.guild
+        if guild is not None and not guild.chunked and guild.id not in self.chunk_requested:
+            self.chunk_requested.add(guild.id)
+            self.loop.create_task(guild.chunk())
+
+    async def start(self, *args, **kwargs):
+        # Opened inside the loop the bot runs on
+        get_session()
+        self.sampler.start()
+        if WATCHDOG_ENABLED:
+            self.watchdog.start()
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        self.outbound.close()
+        self.sampler.close()
+        self.watchdog.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.cleanup()
+        await close_session()
+        await super().close()
 
     async def on_ready(self):
+        # on_ready fires again on every reconnect
+        if METRICS_ENABLED and self.metrics_server is None:
+            self.metrics_server = await start_server(METRICS_HOST, METRICS_PORT)
         print(f"{bot.user.name} is on ready.")  # type: ignore
+        if PROFILE_STARTUP:
+            print(f"Ready {perf_counter() - STARTED:.2f}s after startup")
 
 
+imported = perf_counter()
 bot = Bot()
 
+if PROFILE_STARTUP:
+    PROFILER.uninstall()
+    stages = {"imports": imported - STARTED}
+    stages.update((f"load {ext}", seconds) for ext, seconds in bot.load_times.items())
+    stages["Bot()"] = perf_counter() - imported
+    print(format_profile(PROFILER, stages))
+
 bot.run(DISCORD_TOKEN)
@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+
+from io import BytesIO
+
+pytest.importorskip("discord")
+Image = pytest.importorskip("PIL.Image")
+
+from bot.utils.attachments import AttachmentPipeline, UnsupportedAttachment
+
+
+class StubAttachment:
+    def __init__(self, data, filename="image.png"):
+        self.data = data
+        self.filename = filename
+        self.content_type = "image/png"
+        self.size = len(data)
+
+    async def read(self):
+        return self.data
+
+
+def png(width, height):
+    output = BytesIO()
+    Image.new("1", (width, height)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def prepare(attachment):
+    async def run():
+        pipeline = AttachmentPipeline(max_side=64)
+        try:
+            return await pipeline.prepare([attachment])
+        finally:
+            pipeline.close()
+
+    return asyncio.run(run())
+
+
+def test_images_are_downscaled_to_jpeg():
+    [url] = prepare(StubAttachment(png(200, 100)))
+    assert url.startswith("data:image/jpeg;base64,")
+
+
+def test_images_with_too_many_pixels_are_refused(monkeypatch):
+    # A file of a few hundred bytes can claim dimensions that take gigabytes to decode
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 100 * 100)
+    with pytest.raises(UnsupportedAttachment) as error:
+        prepare(StubAttachment(png(200, 100)))
+    assert error.value.reason == "too large"
+
+
+def test_unreadable_images_are_refused():
+    with pytest.raises(UnsupportedAttachment) as error:
+        prepare(StubAttachment(b"not a png"))
+    assert error.value.reason == "not a readable image"
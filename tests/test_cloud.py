@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+
+from io import BytesIO
+
+web = pytest.importorskip("aiohttp.web")
+from aiohttp import ClientResponseError, ClientSession
+from aiohttp.test_utils import TestServer
+
+from bot.utils.cloud import mystBin_upload
+
+
+class PasteServer:
+    """
+    A local stand-in for mystbin that answers with the given statuses in turn and
+    records every body it receives.
+    """
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.bodies = []
+
+    async def documents(self, request):
+        self.bodies.append(await request.read())
+        status = self.statuses.pop(0)
+        if status != 200:
+            return web.Response(status=status, text="nope")
+        return web.json_response({"key": f"paste{len(self.bodies)}"})
+
+
+def upload(paste, output, **kwargs):
+    async def run():
+        app = web.Application()
+        app.router.add_post("/documents", paste.documents)
+        async with TestServer(app) as server, ClientSession() as session:
+            base_url = str(server.make_url("")).rstrip("/")
+            link = await mystBin_upload(output, session=session, base_url=base_url, backoff=0, **kwargs)
+            return link[len(base_url) + 1 :]
+
+    return asyncio.run(run())
+
+
+def test_server_errors_are_retried():
+    paste = PasteServer(503, 200)
+    assert upload(paste, "hello") == "paste2"
+    assert paste.bodies == [b"hello", b"hello"]
+
+
+def test_client_errors_are_not_retried():
+    paste = PasteServer(400, 200)
+    with pytest.raises(ClientResponseError):
+        upload(paste, "hello")
+    assert len(paste.bodies) == 1
+
+
+def test_retries_give_up_after_the_last():
+    paste = PasteServer(502, 503, 500)
+    with pytest.raises(ClientResponseError) as error:
+        upload(paste, b"hello", retries=2)
+    assert error.value.status == 500
+    assert len(paste.bodies) == 3
+
+
+def test_seekable_files_are_rewound_for_a_retry():
+    paste = PasteServer(503, 200)
+    output = BytesIO(b"skipped" + b"x" * 200_000)
+    output.seek(len("skipped"))
+    assert upload(paste, output) == "paste2"
+    assert paste.bodies == [b"x" * 200_000] * 2
+
+
+def test_generators_are_sent_once():
+    paste = PasteServer(503, 200)
+    with pytest.raises(ClientResponseError) as error:
+        upload(paste, (line for line in ["a\n", b"b\n", "c"]))
+    assert error.value.status == 503
+    assert paste.bodies == [b"a\nb\nc"]
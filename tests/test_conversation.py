@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+from bot.utils import conversation
+from bot.utils.conversation import ConversationBuffer, estimate_tokens
+
+
+def test_messages_are_trimmed_and_built_for_the_api():
+    buffer = ConversationBuffer("system")
+    image = [{"type": "text", "text": "look"}, {"type": "image_url", "image_url": {"url": "data:"}}]
+    buffer.append("user", "a" * 400)
+    buffer.append("user", image)
+    buffer.append("assistant", "nice")
+
+    assert buffer.messages(10_000) == [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "a" * 400},
+        {"role": "user", "content": image},
+        {"role": "assistant", "content": "nice"},
+    ]
+    # The image alone is over this budget, so only the latest message is left
+    assert buffer.messages(100) == [
+        {"role": "system", "content": "system"},
+        {"role": "assistant", "content": "nice"},
+    ]
+
+
+def test_tokens_are_counted_with_the_tokenizer_once_loaded(monkeypatch):
+    monkeypatch.setattr(conversation, "_encoding", None)
+    text = "one two three four five"
+    assert estimate_tokens(text) == len(text) // 4 + 4
+
+    monkeypatch.setattr(conversation, "_encoding", SimpleNamespace(encode_ordinary=str.split))
+    assert estimate_tokens(text) == 5 + 4
+    assert estimate_tokens([{"type": "text", "text": text}, {"type": "image_url"}]) == 5 + 4 + 765
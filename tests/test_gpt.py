@@ -0,0 +1,169 @@
+import asyncio
+import pytest
+
+from types import SimpleNamespace
+
+
+class SlowCompletions:
+    """
+    Stands in for the chat completions of AsyncOpenAI, every completion takes
+    `latency` seconds to arrive.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        message = SimpleNamespace(content="No")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class StubClient:
+    def __init__(self, latency):
+        self.chat = SimpleNamespace(completions=SlowCompletions(latency))
+
+    async def close(self):
+        pass
+
+
+class StubMessage:
+    def __init__(self, content):
+        self.content = content
+
+    async def edit(self, content):
+        self.content = content
+
+
+class StubOutbound:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, channel, content=None, **kwargs):
+        self.sent.append(StubMessage(content))
+        return self.sent[-1]
+
+
+async def stream(text, size=50):
+    for index in range(0, len(text), size):
+        delta = SimpleNamespace(content=text[index : index + size])
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def make_relay(monkeypatch, tmp_path, latency):
+    pytest.importorskip("discord")
+    pytest.importorskip("PIL")
+    from bot.exts.gpt import gpt
+
+    monkeypatch.setattr(gpt, "GPT_DATABASE", str(tmp_path / "gpt.db"))
+    # Nothing gets downloaded, and the tokenizer is left as the other tests expect it
+    monkeypatch.setattr(gpt.GPTRelay, "warm_up", staticmethod(lambda: None))
+    bot = SimpleNamespace(loop=asyncio.get_running_loop(), outbound=StubOutbound())
+    relay = gpt.GPTRelay(bot)  # type: ignore
+    relay._openai_client = StubClient(latency)
+    return relay
+
+
+def test_loop_stays_responsive_during_a_slow_completion(monkeypatch, tmp_path):
+    async def run():
+        relay = make_relay(monkeypatch, tmp_path, latency=0.3)
+        ticks = 0
+        done = False
+
+        async def ticker():
+            nonlocal ticks
+            while not done:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        try:
+            # Ambiguous locally, so it is sent to the model
+            model = await relay.determine_model("paint the town red meaning", [])
+        finally:
+            done = True
+            await task
+            relay.cog_unload()
+        assert model == "gpt-4o"
+        assert ticks > 100
+
+    asyncio.run(run())
+
+
+def test_quotas_are_charged_per_burst(monkeypatch, tmp_path):
+    async def run():
+        relay = make_relay(monkeypatch, tmp_path, latency=0)
+        submitted = []
+
+        def submit(channel_id, job, shed=None):
+            submitted.append(channel_id)
+            return True
+
+        monkeypatch.setattr(relay.scheduler, "submit", submit)
+        author = SimpleNamespace(id=1)
+        channel = SimpleNamespace(id=2)
+        burst = [SimpleNamespace(author=author, channel=channel) for _ in range(10)]
+        try:
+            relay.dispatch(channel.id, burst)
+        finally:
+            relay.cog_unload()
+        assert len(submitted) == 1
+        assert relay.throttled == 0
+        assert relay.user_quota.bucket(author.id).available() == pytest.approx(
+            relay.user_quota.capacity - 1, abs=0.1
+        )
+
+    asyncio.run(run())
+
+
+def test_streamed_code_blocks_are_reopened_in_the_next_message(monkeypatch, tmp_path):
+    async def run():
+        relay = make_relay(monkeypatch, tmp_path, latency=0)
+        from bot.exts.gpt import gpt
+
+        monkeypatch.setattr(gpt, "GPT_STREAM_EDIT_INTERVAL", 0)
+        code = "\n".join(f"print({i})" for i in range(600))
+        text = f"Here you go:\n```python\n{code}\n```\nDone."
+        try:
+            reply = await relay.relay_stream(SimpleNamespace(channel=None), "gpt-4o", stream(text))
+        finally:
+            relay.cog_unload()
+        assert reply == text
+
+        sent = [message.content for message in relay.bot.outbound.sent]
+        assert len(sent) > 1
+        for content in sent:
+            assert len(content) <= 2000
+            assert content.count("```") % 2 == 0
+        for content in sent[1:-1]:
+            assert content.startswith("```python\n")
+        assert "".join(sent).count("print(") == 600
+
+    asyncio.run(run())
+
+
+def test_answers_under_way_are_not_remembered_after_a_clear(monkeypatch, tmp_path):
+    async def run():
+        relay = make_relay(monkeypatch, tmp_path, latency=0)
+        responses = []
+
+        async def respond(text):
+            responses.append(text)
+
+        ctx = SimpleNamespace(channel=SimpleNamespace(id=2), respond=respond)
+        try:
+            history = await relay.get_history(2)
+            generation = relay.generations[2]
+            relay.remember(2, "user", "hello", generation)
+            # Cleared while the answer to it was on its way
+            await type(relay).clearhistory.callback(relay, ctx)
+            relay.remember(2, "assistant", "hi", generation)
+            relay.remember(2, "user", "again", relay.generations[2])
+
+            assert len(history) == 1
+            assert [content for _, content in await relay.store.load(2, 10)] == ["again"]
+        finally:
+            relay.cog_unload()
+        assert responses == ["Conversation history cleared."]
+
+    asyncio.run(run())
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from bot.utils.intent import ImageIntentClassifier
+
+
+class StubRemote:
+    def __init__(self, *verdicts):
+        self.verdicts = list(verdicts)
+        self.prompts = []
+
+    async def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return self.verdicts.pop(0)
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "draw conclusions from this data",
+        "write a function to render images",
+        "paint the town red meaning",
+        "render the image as base64 in code",
+        "how do I resize an image",
+    ],
+)
+def test_ambiguous_prompts_go_remote(prompt):
+    assert ImageIntentClassifier.local(ImageIntentClassifier.normalize(prompt)) is None
+
+
+@pytest.mark.parametrize(
+    "prompt, verdict",
+    [
+        ("Draw me a picture of a cat", True),
+        ("generate an image of a sunset over the sea", True),
+        ("what is the capital of france", False),
+    ],
+)
+def test_obvious_prompts_settle_locally(prompt, verdict):
+    assert ImageIntentClassifier.local(ImageIntentClassifier.normalize(prompt)) is verdict
+
+
+def test_remote_verdicts_are_cached():
+    remote = StubRemote(True)
+    intent = ImageIntentClassifier(remote)
+    assert asyncio.run(intent.classify("draw a cat"))
+    assert asyncio.run(intent.classify("Draw a  cat!"))
+    assert remote.prompts == ["draw a cat"]
+    assert intent.stats == {"remote": 1, "cache": 1}
+
+
+def test_remote_failures_are_not_cached():
+    remote = StubRemote(None, True)
+    intent = ImageIntentClassifier(remote)
+    assert not asyncio.run(intent.classify("draw a cat"))
+    assert asyncio.run(intent.classify("draw a cat"))
+    assert len(remote.prompts) == 2
+    assert intent.stats == {"failed": 1, "remote": 1}
+    assert intent.hit_rates()["failed"] == 0.5
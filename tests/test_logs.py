@@ -0,0 +1,177 @@
+import asyncio
+import pytest
+
+from types import SimpleNamespace
+
+from bot.utils.logs import DeploymentLogCache, filter_entries, merge_logs, parse_timestamp
+
+
+def entries(count, start=0):
+    return [
+        {"ts": f"2024-01-01T00:00:{i:02d}.000000Z", "line": f"WARN line {i}"}
+        for i in range(start, start + count)
+    ]
+
+
+class StubLogs:
+    """
+    Stands in for the pages logs endpoint of AsyncCloudflare, the log grows by
+    `growth` entries on every fetch.
+    """
+
+    def __init__(self, initial, growth=0, latency=0.01):
+        self.log = entries(initial)
+        self.growth = growth
+        self.latency = latency
+        self.calls = 0
+
+    async def get(self, deployment_id, *, account_id, project_name):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        data = list(self.log)
+        self.log.extend(entries(self.growth, len(self.log)))
+        return {"data": data}
+
+
+def stub_cloudflare(logs: StubLogs):
+    history = SimpleNamespace(logs=logs)
+    return SimpleNamespace(
+        pages=SimpleNamespace(projects=SimpleNamespace(deployments=SimpleNamespace(history=history)))
+    )
+
+
+def refresh(cache, deployment_id, fetched):
+    start = cache.unseen(cache.get(deployment_id), fetched)
+    return cache.update(deployment_id, fetched, start, list(filter_entries(fetched[start:])))
+
+
+def test_refresh_only_filters_new_entries():
+    cache = DeploymentLogCache(max_bytes=2**20, refresh_interval=0)
+    log = entries(10)
+    refresh(cache, "a", log[:5])
+    cached = refresh(cache, "a", log)
+    assert len(cached.lines_since()) == 10
+    assert cached.seen == 10
+
+
+def test_stale_filter_results_are_dropped():
+    cache = DeploymentLogCache(max_bytes=2**20, refresh_interval=0)
+    log = entries(5)
+    # Two fetches worked out where to start before either was recorded
+    first = cache.unseen(cache.get("a"), log)
+    second = cache.unseen(cache.get("a"), log)
+    cache.update("a", log, first, list(filter_entries(log[first:])))
+    cached = cache.update("a", log, second, list(filter_entries(log[second:])))
+    assert len(cached.lines_since()) == 5
+
+
+def test_rewritten_log_starts_over():
+    cache = DeploymentLogCache(max_bytes=2**20, refresh_interval=0)
+    refresh(cache, "a", entries(5))
+    cached = refresh(cache, "a", entries(3, start=20))
+    assert len(cached.lines_since()) == 3
+    assert cache.size == sum(map(len, cached.lines))
+
+
+def test_least_recently_used_log_is_evicted():
+    line = len(list(filter_entries(entries(1)))[0])
+    cache = DeploymentLogCache(max_bytes=line * 15, refresh_interval=0)
+    refresh(cache, "a", entries(10))
+    refresh(cache, "b", entries(10))
+    assert cache.get("b").seen == 10
+    assert cache.get("a") is None
+
+
+def test_lookups_do_not_add_logs():
+    cache = DeploymentLogCache(max_bytes=2**20, refresh_interval=60)
+    for i in range(1000):
+        assert not cache.is_fresh(cache.get(f"mistyped-{i}"))
+    assert len(cache._logs) == 0
+
+
+def test_log_evicted_while_filtering_is_filtered_again():
+    cache = DeploymentLogCache(max_bytes=2**20, refresh_interval=0)
+    refresh(cache, "a", entries(5))
+    log = entries(8)
+    start = cache.unseen(cache.get("a"), log)
+    cache._logs.clear()
+    assert cache.update("a", log, start, list(filter_entries(log[start:]))) is None
+    assert len(refresh(cache, "a", log).lines_since()) == 8
+
+
+def test_since_skips_older_lines():
+    cache = DeploymentLogCache(max_bytes=2**20, refresh_interval=0)
+    cached = refresh(cache, "a", entries(10))
+    since = cached.lines_since(parse_timestamp("2024-01-01T00:00:07Z"))
+    assert [line.split("\t")[0][17:19] for line in since] == ["07", "08", "09"]
+
+
+def test_merge_keeps_every_log_in_time_order():
+    merged = list(
+        merge_logs(
+            {
+                "first": ["2024-01-01T00:00:01Z\tx", "2024-01-01T00:00:03Z\ty"],
+                "second": ["2024-01-01T00:00:02Z\tz"],
+            }
+        )
+    )
+    assert merged == [
+        "2024-01-01T00:00:01Z\t[first]\tx",
+        "2024-01-01T00:00:02Z\t[second]\tz",
+        "2024-01-01T00:00:03Z\t[first]\ty",
+    ]
+
+
+def test_merge_labels_tell_apart_ids_with_a_shared_prefix():
+    first = "abcdef12-0000-4000-8000-000000000001"
+    second = "abcdef12-0000-4000-8000-000000000002"
+    merged = list(
+        merge_logs(
+            {
+                first: ["2024-01-01T00:00:01Z\tx"],
+                second: ["2024-01-01T00:00:02Z\ty"],
+                "0123456789": ["2024-01-01T00:00:03Z\tz"],
+            }
+        )
+    )
+    assert merged == [
+        f"2024-01-01T00:00:01Z\t[{first}]\tx",
+        f"2024-01-01T00:00:02Z\t[{second}]\ty",
+        "2024-01-01T00:00:03Z\t[01234567]\tz",
+    ]
+
+
+def make_tools(logs: StubLogs):
+    pytest.importorskip("discord")
+    from bot.exts.tools.tools import Tools
+
+    tools = Tools(bot=None)  # type: ignore
+    tools._client = stub_cloudflare(logs)
+    tools.logs.refresh_interval = 0
+    return tools
+
+
+def test_concurrent_show_logs_share_one_fetch():
+    async def run():
+        logs = StubLogs(5)
+        tools = make_tools(logs)
+        first, second = await asyncio.gather(
+            tools.fetch_log("project", "a"), tools.fetch_log("project", "a")
+        )
+        assert first is second
+        assert logs.calls == 1
+        assert len(first.lines_since()) == 5
+
+    asyncio.run(run())
+
+
+def test_later_show_logs_append_new_entries_once():
+    async def run():
+        logs = StubLogs(5, growth=3)
+        tools = make_tools(logs)
+        await tools.fetch_log("project", "a")
+        cached = await tools.fetch_log("project", "a")
+        assert logs.calls == 2
+        assert len(cached.lines_since()) == 8
+
+    asyncio.run(run())
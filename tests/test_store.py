@@ -0,0 +1,53 @@
+import asyncio
+
+from bot.utils.store import ConversationStore
+
+
+def test_close_writes_out_the_queue(tmp_path):
+    path = str(tmp_path / "gpt.db")
+
+    async def run():
+        store = ConversationStore(path, flush_interval=60)
+        store.start()
+        store.append(1, "user", "hello")
+        store.append(1, "assistant", [{"type": "text", "text": "hi"}])
+        # Nothing gets to await the final flush when the cog unloads
+        store.close()
+
+    asyncio.run(run())
+
+    async def reopen():
+        store = ConversationStore(path)
+        try:
+            return await store.load(1, 10)
+        finally:
+            store.close()
+
+    assert asyncio.run(reopen()) == [
+        ("user", "hello"),
+        ("assistant", [{"type": "text", "text": "hi"}]),
+    ]
+
+
+def test_close_waits_for_a_cancelled_flush(tmp_path):
+    path = str(tmp_path / "gpt.db")
+
+    async def run():
+        store = ConversationStore(path, flush_interval=0)
+        store.append(1, "user", "first")
+        flush = asyncio.create_task(store.flush())
+        await asyncio.sleep(0)
+        flush.cancel()
+        store.append(1, "user", "second")
+        store.close()
+
+    asyncio.run(run())
+
+    async def reopen():
+        store = ConversationStore(path)
+        try:
+            return await store.load(1, 10)
+        finally:
+            store.close()
+
+    assert asyncio.run(reopen()) == [("user", "first"), ("user", "second")]